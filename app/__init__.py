@@ -112,6 +112,13 @@ if not SKIP_RUNTIME_INIT:
                 f"you can't use /{XRAY_SUBSCRIPTION_PATH}/ as subscription path it reserved for {app.title}"
             )
 
+        # Resolve the users.status enum once per process instead of on the delete path
+        try:
+            with GetDB() as db:
+                crud._ensure_user_deleted_status(db)
+        except Exception as e:
+            logger.warning(f"Failed to verify user status enum: {e}", exc_info=True)
+
         # Start Redis if configured to do so
         start_redis_if_configured()
 
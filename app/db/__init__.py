@@ -47,6 +47,7 @@ from .crud import (
     update_user,
     update_user_status,
     reset_user_by_next,
+    reset_users_by_next,
     update_user_sub,
     start_user_expire,
     get_admin_by_id,
@@ -69,6 +70,7 @@ __all__ = [
     "start_user_expire",
     "update_user_sub",
     "reset_user_by_next",
+    "reset_users_by_next",
     "revoke_user_sub",
     "set_owner",
     "get_system_usage",
@@ -7,7 +7,6 @@ import secrets
 from hashlib import sha256
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional
-from types import SimpleNamespace
 
 from sqlalchemy import and_, case, func, or_
 from sqlalchemy.exc import IntegrityError
@@ -162,7 +161,7 @@ def enforce_admin_data_limit(db: Session, dbadmin: Admin) -> bool:
         if xray:
             for user_row in active_users:
                 try:
-                    xray.operations.remove_user(dbuser=SimpleNamespace(id=user_row.id, username=user_row.username))
+                    xray.operations.remove_user_by_id(user_row.id, user_row.username)
                 except Exception:
                     continue
 
@@ -333,13 +332,15 @@ def remove_admin(db: Session, dbadmin: Admin) -> Admin:
     if dbadmin.id is None:
         raise ValueError("Admin must have a valid identifier before removal")
 
-    admin_users = db.query(User).filter(User.admin_id == dbadmin.id, User.status != UserStatus.deleted).all()
-    for dbuser in admin_users:
-        dbuser.status = UserStatus.deleted
+    admin_users = db.query(User).filter(User.admin_id == dbadmin.id, User.status != UserStatus.deleted)
+    # Removing users from the core only needs their id and username
+    user_rows = admin_users.with_entities(User.id, User.username).all()
+    admin_users.update({User.status: UserStatus.deleted}, synchronize_session=False)
+    for user_row in user_rows:
         try:
             from app.reb_node import operations as core_operations
 
-            core_operations.remove_user(dbuser=dbuser)
+            core_operations.remove_user_by_id(user_row.id, user_row.username)
         except Exception:
             pass
     db.query(AdminServiceLink).filter(AdminServiceLink.admin_id == dbadmin.id).delete(synchronize_session=False)
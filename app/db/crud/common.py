@@ -3,6 +3,7 @@
 import logging
 
 import sqlalchemy as sa
+from sqlalchemy.engine import Engine
 
 
 _logger = logging.getLogger(__name__)
@@ -14,14 +15,8 @@ _USER_STATUS_ENUM_ENSURED = False
 
 def _is_record_changed_error(exc) -> bool:
     """Check if error is a record changed error."""
-    orig = getattr(exc, "orig", None)
-    if not orig:
-        return False
-    try:
-        err_code = orig.args[0]
-    except (AttributeError, IndexError):
-        return False
-    return err_code == _RECORD_CHANGED_ERRNO
+    args = getattr(getattr(exc, "orig", None), "args", ())
+    return len(args) > 0 and args[0] == _RECORD_CHANGED_ERRNO
 
 
 def _ensure_user_deleted_status(db) -> bool:
@@ -32,19 +27,20 @@ def _ensure_user_deleted_status(db) -> bool:
     bind = db.get_bind()
     if bind is None:
         return False
-    engine = getattr(bind, "engine", bind)
+    engine = bind if isinstance(bind, Engine) else bind.engine
     dialect = engine.dialect.name
     try:
         inspector = sa.inspect(engine)
         columns = inspector.get_columns("users")
-    except Exception:
+    except sa.exc.SQLAlchemyError:
         return False
-    status_column = next((col for col in columns if col.get("name") == "status"), None)
+    cols_by_name = {col["name"]: col for col in columns}
+    status_column = cols_by_name.get("status")
     if not status_column:
         return False
     enum_type = status_column.get("type")
-    enum_values = getattr(enum_type, "enums", None)
-    if enum_values and "deleted" in enum_values:
+    enum_values = frozenset(getattr(enum_type, "enums", None) or ())
+    if "deleted" in enum_values:
         _USER_STATUS_ENUM_ENSURED = True
         return True
     try:
@@ -59,7 +55,7 @@ def _ensure_user_deleted_status(db) -> bool:
                 conn.exec_driver_sql("ALTER TYPE userstatus ADD VALUE IF NOT EXISTS 'deleted'")
         else:
             return False
-    except Exception:
+    except sa.exc.SQLAlchemyError:
         return False
     _USER_STATUS_ENUM_ENSURED = True
     return True
@@ -3,9 +3,12 @@ Functions for managing proxy hosts, users, user templates, nodes, and administra
 """
 
 import logging
+import threading
+import time
 from datetime import datetime, timezone
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
 from app.db.models import (
     MasterNodeState,
@@ -24,9 +27,44 @@ _logger = logging.getLogger(__name__)
 _RECORD_CHANGED_ERRNO = 1020
 ADMIN_DATA_LIMIT_EXHAUSTED_REASON_KEY = "admin_data_limit_exhausted"
 
+# Process-wide ``Node.id -> Node.name`` map used by the usage reports.
+_NODE_LOOKUP_TTL_SECONDS = 60
+_NODE_LOOKUP_CACHE: Tuple[float, Dict[Optional[int], str]] = (float("-inf"), {})
+_NODE_LOOKUP_LOCK = threading.Lock()
+
 # ============================================================================
 
 
+def _get_node_lookup(db: Session) -> Dict[Optional[int], str]:
+    """
+    Return the cached ``{node_id: node_name}`` map, with the master core under the ``None`` key.
+
+    Keys are in report order: master first, then ascending node id. The mapping is shared
+    between callers and must not be mutated.
+    """
+    global _NODE_LOOKUP_CACHE
+
+    fetched_at, lookup = _NODE_LOOKUP_CACHE
+    if time.monotonic() - fetched_at < _NODE_LOOKUP_TTL_SECONDS:
+        return lookup
+
+    with _NODE_LOOKUP_LOCK:
+        fetched_at, lookup = _NODE_LOOKUP_CACHE
+        if time.monotonic() - fetched_at < _NODE_LOOKUP_TTL_SECONDS:
+            return lookup
+        lookup = {None: MASTER_NODE_NAME}
+        for node_id, node_name in db.query(Node.id, Node.name).order_by(Node.id).all():
+            lookup[node_id] = node_name
+        _NODE_LOOKUP_CACHE = (time.monotonic(), lookup)
+    return lookup
+
+
+def invalidate_node_lookup_cache() -> None:
+    """Force the next usage report to reload node names from the database."""
+    global _NODE_LOOKUP_CACHE
+    _NODE_LOOKUP_CACHE = (float("-inf"), {})
+
+
 def get_node(db: Session, name: Optional[str] = None, node_id: Optional[int] = None) -> Optional[Node]:
     """Retrieves a node by its name or ID."""
     query = db.query(Node)
@@ -42,20 +80,33 @@ def get_node_by_id(db: Session, node_id: int) -> Optional[Node]:
     return get_node(db, node_id=node_id)
 
 
+_MASTER_STATE_INFO_KEY = "master_node_state"
+
+
 def _ensure_master_state(db: Session, *, for_update: bool = False) -> MasterNodeState:
-    """Retrieve or create the singleton master node state entry."""
+    """Retrieve or create the singleton master node state entry.
+
+    The entry is remembered in ``db.info`` so repeated lookups in the same session skip the SELECT;
+    ``for_update`` always queries so the row lock is taken.
+    """
+    if not for_update:
+        cached = db.info.get(_MASTER_STATE_INFO_KEY)
+        # A rolled back insert or a delete detaches the instance, in which case look it up again
+        if cached is not None and cached in db and not inspect(cached).deleted:
+            return cached
+
     query = db.query(MasterNodeState)
     if for_update:
         query = query.with_for_update()
 
     state = query.first()
-    if state:
-        return state
+    if not state:
+        state = MasterNodeState(status=NodeStatus.connected)
+        db.add(state)
+        db.flush()
+        db.refresh(state)
 
-    state = MasterNodeState(status=NodeStatus.connected)
-    db.add(state)
-    db.flush()
-    db.refresh(state)
+    db.info[_MASTER_STATE_INFO_KEY] = state
     return state
 
 
@@ -136,6 +187,7 @@ def create_node(db: Session, node: NodeCreate) -> Node:
         dbnode.certificate_key = cert_data["key"]
 
     db.commit()
+    invalidate_node_lookup_cache()
     db.refresh(dbnode)
     return dbnode
 
@@ -161,6 +213,7 @@ def remove_node(db: Session, dbnode: Node) -> Node:
     db.query(NodeUserUsage).filter(NodeUserUsage.node_id == dbnode.id).delete(synchronize_session=False)
     db.delete(dbnode)
     db.commit()
+    invalidate_node_lookup_cache()
     return dbnode
 
 
@@ -202,6 +255,8 @@ def update_node(db: Session, dbnode: Node, modify: NodeModify) -> Node:
             if modify.status is None and dbnode.status == NodeStatus.limited:
                 dbnode.status, dbnode.message = NodeStatus.connecting, None
     db.commit()
+    if modify.name is not None:
+        invalidate_node_lookup_cache()
     db.refresh(dbnode)
     return dbnode
 
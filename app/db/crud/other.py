@@ -20,6 +20,7 @@ from app.db.models import (
 )
 from app.models.admin import AdminRole, AdminStatus
 from app.utils.credentials import (
+    _as_proxy_type,
     serialize_proxy_settings,
 )
 from app.models.proxy import ProxySettings
@@ -142,7 +143,7 @@ class ServiceRepository:
             if not protocol:
                 continue
             try:
-                proxy_type = ProxyTypes(protocol)
+                proxy_type = _as_proxy_type(protocol)
             except ValueError:
                 continue
             allowed.setdefault(proxy_type, set()).add(inbound_tag)
@@ -154,6 +155,7 @@ class ServiceRepository:
         dbuser: User,
         service: Service,
         allowed_inbounds: Optional[Dict[ProxyTypes, Set[str]]] = None,
+        edited_at: Optional[datetime] = None,
     ) -> None:
         from app.runtime import xray
 
@@ -164,7 +166,7 @@ class ServiceRepository:
         existing_proxies: Dict[ProxyTypes, Proxy] = {}
 
         for proxy in list(dbuser.proxies):
-            proxy_type = ProxyTypes(proxy.type)
+            proxy_type = _as_proxy_type(proxy.type)
             if proxy_type not in allowed_protocols:
                 self.db.delete(proxy)
                 continue
@@ -200,7 +202,7 @@ class ServiceRepository:
             proxy.excluded_inbounds = [get_or_create_inbound(self.db, tag) for tag in excluded_tags]
 
         dbuser.service = service
-        dbuser.edit_at = datetime.now(timezone.utc)
+        dbuser.edit_at = edited_at or datetime.now(timezone.utc)
 
     def refresh_users(
         self, service: Service, allowed_inbounds: Optional[Dict[ProxyTypes, Set[str]]] = None
@@ -208,10 +210,11 @@ class ServiceRepository:
         if allowed_inbounds is None:
             allowed_inbounds = self.compute_allowed_inbounds(service)
         updated_users: List[User] = []
+        edited_at = datetime.now(timezone.utc)
         for user in service.users:
             if user.status == UserStatus.deleted:
                 continue
-            self.apply_service_to_user(user, service, allowed_inbounds)
+            self.apply_service_to_user(user, service, allowed_inbounds, edited_at=edited_at)
             updated_users.append(user)
         self.db.flush()
         return updated_users
@@ -391,9 +394,10 @@ class ServiceRepository:
                     user.service_id = target_service.id if target_service else None
                     transferred_users.append(user)
             elif mode == "delete_users":
+                from .user import hard_delete_users
+
                 deleted_users.extend(service_users)
-                for user in service_users:
-                    self.db.delete(user)
+                hard_delete_users(self.db, service_users)
             else:
                 raise ValueError("Invalid delete mode")
 
@@ -417,12 +421,13 @@ class ServiceRepository:
         return deleted_users, transferred_users
 
     def reset_usage(self, service: Service) -> Service:
+        now = datetime.now(timezone.utc)
         service.used_traffic = 0
-        service.updated_at = datetime.now(timezone.utc)
+        service.updated_at = now
 
         for link in service.admin_links:
             link.used_traffic = 0
-            link.updated_at = datetime.now(timezone.utc)
+            link.updated_at = now
 
         self.db.commit()
         self.db.refresh(service)
@@ -19,6 +19,7 @@ from app.db.models import (
     template_inbounds_association,
 )
 from app.utils.credentials import (
+    _as_proxy_type,
     normalize_key,
     serialize_proxy_settings,
     uuid_to_key,
@@ -53,9 +54,7 @@ def _extract_key_from_proxies(proxies: Dict[ProxyTypes, ProxySettings]) -> Optio
 def _apply_key_to_existing_proxies(dbuser: User, credential_key: str) -> None:
     normalized = normalize_key(credential_key)
     for proxy in dbuser.proxies:
-        proxy_type = proxy.type
-        if isinstance(proxy_type, str):
-            proxy_type = ProxyTypes(proxy_type)
+        proxy_type = _as_proxy_type(proxy.type)
         settings_obj = ProxySettings.from_dict(proxy_type, proxy.settings)
         # Preserve existing UUID if it exists in the database
         existing_uuid = proxy.settings.get("id") if isinstance(proxy.settings, dict) else None
@@ -145,6 +144,18 @@ class ProxyInboundRepository:
         self.db.refresh(inbound)
         return inbound
 
+    def get_or_create_many(self, inbound_tags: Iterable[str]) -> Dict[str, ProxyInbound]:
+        """Resolve several tags with one IN query; only tags not stored yet go through get_or_create."""
+        tags = set(inbound_tags)
+        if not tags:
+            return {}
+        inbounds = {
+            inbound.tag: inbound for inbound in self.db.query(ProxyInbound).filter(ProxyInbound.tag.in_(tags)).all()
+        }
+        for tag in tags - inbounds.keys():
+            inbounds[tag] = self.get_or_create(tag)
+        return inbounds
+
     def delete(self, inbound_tag: str) -> bool:
         inbound = self.db.query(ProxyInbound).filter(ProxyInbound.tag == inbound_tag).first()
         if inbound is None:
@@ -277,6 +288,10 @@ def get_or_create_inbound(db: Session, inbound_tag: str) -> ProxyInbound:
     return ProxyInboundRepository(db).get_or_create(inbound_tag)
 
 
+def get_or_create_inbounds(db: Session, inbound_tags: Iterable[str]) -> Dict[str, ProxyInbound]:
+    return ProxyInboundRepository(db).get_or_create_many(inbound_tags)
+
+
 def get_hosts(db: Session, inbound_tag: str) -> List[ProxyHost]:
     return ProxyInboundRepository(db).list_hosts(inbound_tag)
 
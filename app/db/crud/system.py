@@ -3,12 +3,14 @@ Functions for managing proxy hosts, users, user templates, nodes, and administra
 """
 
 import logging
-from copy import deepcopy
-from typing import Any, Dict
+import os
+from typing import Any, Dict, Optional
 
 import sqlalchemy as sa
-from sqlalchemy import inspect
-from sqlalchemy.exc import OperationalError
+from sqlalchemy import insert, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError, ProgrammingError
 from sqlalchemy.orm import Session
 from app.db.models import (
     JWT,
@@ -29,36 +31,64 @@ MASTER_NODE_NAME = "Master"
 
 _USER_STATUS_ENUM_ENSURED = False
 
+# Normalized contents of the singleton xray_config row, kept in sync by save_xray_config().
+_XRAY_CONFIG_CACHE: Optional[Dict[str, Any]] = None
+# Normalized legacy xray_config.json (or built-in default), parsed once per process.
+_LEGACY_XRAY_DEFAULT: Optional[Dict[str, Any]] = None
+
 _logger = logging.getLogger(__name__)
 _RECORD_CHANGED_ERRNO = 1020
 ADMIN_DATA_LIMIT_EXHAUSTED_REASON_KEY = "admin_data_limit_exhausted"
 
+# Resolved once: the JWT model's columns are fixed at import time.
+_JWT_COLUMNS = frozenset(sa.inspect(JWT).columns.keys())
+_JWT_HAS_ADMIN_KEY = "admin_secret_key" in _JWT_COLUMNS
+_JWT_HAS_LEGACY_KEY = "secret_key" in _JWT_COLUMNS
+_JWT_HAS_VMESS_MASK = "vmess_mask" in _JWT_COLUMNS
+_JWT_HAS_VLESS_MASK = "vless_mask" in _JWT_COLUMNS
+
+# Singleton-row statements, built once; SQLAlchemy caches their compiled form by cache key.
+_JWT_SELECT = select(JWT).limit(1)
+_JWT_MASKS_SELECT = text("SELECT vmess_mask, vless_mask FROM jwt LIMIT 1")
+_SYSTEM_SELECT = select(System).limit(1)
+_TLS_SELECT = select(TLS).limit(1)
+
 # ============================================================================
 
 
+def _generate_jwt_secrets() -> tuple[str, str, str, str]:
+    """Return (subscription_key, admin_key, vmess_mask, vless_mask) from a single random draw."""
+    buf = os.urandom(32 + 32 + 16 + 16)
+    return buf[:32].hex(), buf[32:64].hex(), buf[64:80].hex(), buf[80:].hex()
+
+
+# MasterSettingsService not available, using config directly
+_DEFAULT_ADMIN_SUB_SETTINGS: Dict[str, Any] = {
+    "subscription_links": (XRAY_SUBSCRIPTION_URL_PREFIX or "",),
+    "subscription_path": XRAY_SUBSCRIPTION_PATH,
+    "subscription_template": None,
+    "subscription_support_url": SUB_SUPPORT_URL,
+    "subscription_title": SUB_PROFILE_TITLE,
+}
+
+
 def _default_admin_subscription_settings(db: Session) -> dict:
-    # MasterSettingsService not available, using config directly
-    links = (
-        [XRAY_SUBSCRIPTION_URL_PREFIX] if XRAY_SUBSCRIPTION_URL_PREFIX or XRAY_SUBSCRIPTION_URL_PREFIX == "" else [""]
-    )
-    return {
-        "subscription_links": links,
-        "subscription_path": XRAY_SUBSCRIPTION_PATH,
-        "subscription_template": None,
-        "subscription_support_url": SUB_SUPPORT_URL,
-        "subscription_title": SUB_PROFILE_TITLE,
-    }
+    settings = _DEFAULT_ADMIN_SUB_SETTINGS.copy()
+    settings["subscription_links"] = list(settings["subscription_links"])
+    return settings
 
 
 def _is_record_changed_error(exc: OperationalError) -> bool:
-    orig = getattr(exc, "orig", None)
-    if not orig:
-        return False
-    try:
-        err_code = orig.args[0]
-    except (AttributeError, IndexError):
-        return False
-    return err_code == _RECORD_CHANGED_ERRNO
+    args = getattr(getattr(exc, "orig", None), "args", ())
+    return len(args) > 0 and args[0] == _RECORD_CHANGED_ERRNO
+
+
+def _legacy_xray_config() -> Dict[str, Any]:
+    """Return a fresh copy of the legacy xray config, reading it from disk only once."""
+    global _LEGACY_XRAY_DEFAULT
+    if _LEGACY_XRAY_DEFAULT is None:
+        _LEGACY_XRAY_DEFAULT = apply_log_paths(load_legacy_xray_config())
+    return apply_log_paths(_LEGACY_XRAY_DEFAULT)
 
 
 def _get_or_create_xray_config(db: Session) -> XrayConfig:
@@ -67,29 +97,47 @@ def _get_or_create_xray_config(db: Session) -> XrayConfig:
 
     config = db.get(XrayConfig, 1)
     if config is None:
-        config = XrayConfig(id=1, data=apply_log_paths(load_legacy_xray_config()))
+        config = XrayConfig(id=1, data=_legacy_xray_config())
         db.add(config)
         db.commit()
         db.refresh(config)
     return config
 
 
+def invalidate_xray_config_cache() -> None:
+    """Drop the cached xray config so the next read goes back to the database."""
+    global _XRAY_CONFIG_CACHE
+    _XRAY_CONFIG_CACHE = None
+
+
 def get_xray_config(db: Session) -> Dict[str, Any]:
+    global _XRAY_CONFIG_CACHE
+
+    cached = _XRAY_CONFIG_CACHE
+    if cached is not None:
+        return apply_log_paths(cached)
+
     if not _xray_config_table_exists(db):
-        return apply_log_paths(load_legacy_xray_config())
+        return _legacy_xray_config()
 
     config = _get_or_create_xray_config(db)
-    return apply_log_paths(config.data or {})
+    _XRAY_CONFIG_CACHE = apply_log_paths(config.data or {})
+    return apply_log_paths(_XRAY_CONFIG_CACHE)
 
 
 def save_xray_config(db: Session, payload: Dict[str, Any]) -> Dict[str, Any]:
+    global _XRAY_CONFIG_CACHE
+
+    # apply_log_paths already returns a detached deep copy of the payload.
     normalized_payload = apply_log_paths(payload or {})
     config = _get_or_create_xray_config(db)
-    config.data = deepcopy(normalized_payload or {})
-    db.add(config)
+    config.data = normalized_payload
     db.commit()
     db.refresh(config)
-    return deepcopy(config.data or {})
+    # refresh() reloads a freshly deserialized dict, so no further copy is needed and
+    # normalized_payload is no longer shared with the session.
+    _XRAY_CONFIG_CACHE = normalized_payload
+    return config.data or {}
 
 
 def _xray_config_table_exists(db: Session) -> bool:
@@ -120,22 +168,23 @@ def _ensure_user_deleted_status(db: Session) -> bool:
     if bind is None:
         return False
 
-    engine = getattr(bind, "engine", bind)
+    engine = bind if isinstance(bind, Engine) else bind.engine
     dialect = engine.dialect.name
 
     try:
         inspector = sa.inspect(engine)
         columns = inspector.get_columns("users")
-    except Exception:  # pragma: no cover - inspector failure
+    except sa.exc.SQLAlchemyError:  # pragma: no cover - inspector failure
         return False
 
-    status_column = next((col for col in columns if col.get("name") == "status"), None)
+    cols_by_name = {col["name"]: col for col in columns}
+    status_column = cols_by_name.get("status")
     if not status_column:
         return False
 
     enum_type = status_column.get("type")
-    enum_values = getattr(enum_type, "enums", None)
-    if enum_values and "deleted" in enum_values:
+    enum_values = frozenset(getattr(enum_type, "enums", None) or ())
+    if "deleted" in enum_values:
         _USER_STATUS_ENUM_ENSURED = True
         return True
 
@@ -152,7 +201,7 @@ def _ensure_user_deleted_status(db: Session) -> bool:
         else:
             # SQLite and other backends require running the Alembic migration.
             return False
-    except Exception:  # pragma: no cover - ALTER failure
+    except sa.exc.SQLAlchemyError:  # pragma: no cover - ALTER failure
         return False
 
     _USER_STATUS_ENUM_ENSURED = True
@@ -169,24 +218,38 @@ def get_system_usage(db: Session) -> System:
     Returns:
         System: System usage information.
     """
-    return db.query(System).first()
+    return db.execute(_SYSTEM_SELECT).scalars().first()
+
+
+def _insert_jwt_record_if_missing(db: Session) -> None:
+    """Insert the singleton JWT row, leaving any row created concurrently by another worker untouched."""
+    subscription_key, admin_key, vmess_mask, vless_mask = _generate_jwt_secrets()
+    values = {
+        "id": 1,
+        "subscription_secret_key": subscription_key,
+        "admin_secret_key": admin_key,
+        "vmess_mask": vmess_mask,
+        "vless_mask": vless_mask,
+    }
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = pg_insert(JWT).values(**values).on_conflict_do_nothing(index_elements=[JWT.id])
+    else:
+        stmt = insert(JWT).values(**values)
+        if dialect == "mysql":
+            stmt = stmt.prefix_with("IGNORE")
+        elif dialect == "sqlite":
+            stmt = stmt.prefix_with("OR IGNORE")
+    db.execute(stmt)
+    db.commit()
 
 
 def _get_or_create_jwt_record(db: Session) -> JWT:
     """Helper to get or create JWT record."""
-    jwt_record = db.query(JWT).first()
+    jwt_record = db.execute(_JWT_SELECT).scalars().first()
     if jwt_record is None:
-        import os
-
-        jwt_record = JWT(
-            subscription_secret_key=os.urandom(32).hex(),
-            admin_secret_key=os.urandom(32).hex(),
-            vmess_mask=os.urandom(16).hex(),
-            vless_mask=os.urandom(16).hex(),
-        )
-        db.add(jwt_record)
-        db.commit()
-        db.refresh(jwt_record)
+        _insert_jwt_record_if_missing(db)
+        jwt_record = db.execute(_JWT_SELECT).scalars().one()
     return jwt_record
 
 
@@ -202,18 +265,11 @@ def get_jwt_secret_key(db: Session) -> str:
         str: Admin JWT secret key.
     """
     jwt_record = _get_or_create_jwt_record(db)
-    if hasattr(jwt_record, "admin_secret_key") and jwt_record.admin_secret_key:
+    if _JWT_HAS_ADMIN_KEY and jwt_record.admin_secret_key:
         return jwt_record.admin_secret_key
-    elif hasattr(jwt_record, "secret_key") and jwt_record.secret_key:
+    if _JWT_HAS_LEGACY_KEY and jwt_record.secret_key:
         return jwt_record.secret_key
-    else:
-        import os
-
-        if not hasattr(jwt_record, "admin_secret_key"):
-            jwt_record.admin_secret_key = os.urandom(32).hex()
-            db.commit()
-            db.refresh(jwt_record)
-        return jwt_record.admin_secret_key
+    return jwt_record.admin_secret_key
 
 
 def get_subscription_secret_key(db: Session) -> str:
@@ -236,60 +292,32 @@ def get_uuid_masks(db: Session) -> dict:
     Returns:
         dict: Dictionary with 'vmess_mask' and 'vless_mask' keys, each containing a 32-character hex string.
     """
-    import os
-    from sqlalchemy import text
+    # Fast path: read the masks without hydrating a JWT instance.
+    try:
+        row = db.execute(_JWT_MASKS_SELECT).first()
+    except (OperationalError, ProgrammingError):
+        db.rollback()
+        row = None
+    if row and row[0] and row[1]:
+        return {"vmess_mask": row[0], "vless_mask": row[1]}
 
-    jwt_record = db.query(JWT).first()
-    if jwt_record is None:
-        jwt_record = JWT(
-            subscription_secret_key=os.urandom(32).hex(),
-            admin_secret_key=os.urandom(32).hex(),
-        )
-        try:
-            setattr(jwt_record, "vmess_mask", os.urandom(16).hex())
-            setattr(jwt_record, "vless_mask", os.urandom(16).hex())
-        except Exception:
-            pass
-        db.add(jwt_record)
-        db.commit()
-        try:
-            db.refresh(jwt_record)
-        except Exception:
-            pass
+    if not (_JWT_HAS_VMESS_MASK and _JWT_HAS_VLESS_MASK):
+        _, _, vm, vl = _generate_jwt_secrets()
+        return {"vmess_mask": vm, "vless_mask": vl}
 
+    jwt_record = _get_or_create_jwt_record(db)
+    if jwt_record.vmess_mask and jwt_record.vless_mask:
+        return {"vmess_mask": jwt_record.vmess_mask, "vless_mask": jwt_record.vless_mask}
+
+    # Legacy row whose masks were never backfilled.
+    vm = jwt_record.vmess_mask or os.urandom(16).hex()
+    vl = jwt_record.vless_mask or os.urandom(16).hex()
+    jwt_record.vmess_mask = vm
+    jwt_record.vless_mask = vl
     try:
-        vm = getattr(jwt_record, "vmess_mask")
-        vl = getattr(jwt_record, "vless_mask")
-    except AttributeError:
-        try:
-            row = db.execute(text("SELECT vmess_mask, vless_mask FROM jwt LIMIT 1")).first()
-            if row and row[0] and row[1]:
-                return {"vmess_mask": row[0], "vless_mask": row[1]}
-        except Exception:
-            pass
-        return {"vmess_mask": os.urandom(16).hex(), "vless_mask": os.urandom(16).hex()}
-
-    updated = False
-    if not vm:
-        vm = os.urandom(16).hex()
-        try:
-            setattr(jwt_record, "vmess_mask", vm)
-            updated = True
-        except Exception:
-            pass
-    if not vl:
-        vl = os.urandom(16).hex()
-        try:
-            setattr(jwt_record, "vless_mask", vl)
-            updated = True
-        except Exception:
-            pass
-    if updated:
-        try:
-            db.add(jwt_record)
-            db.commit()
-        except Exception:
-            db.rollback()
+        db.commit()
+    except (IntegrityError, OperationalError, DataError):
+        db.rollback()
 
     return {"vmess_mask": vm, "vless_mask": vl}
 
@@ -304,4 +332,4 @@ def get_tls_certificate(db: Session) -> TLS:
     Returns:
         TLS: TLS certificate information.
     """
-    return db.query(TLS).first()
+    return db.execute(_TLS_SELECT).scalars().first()
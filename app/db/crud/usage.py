@@ -4,14 +4,15 @@ Functions for managing proxy hosts, users, user templates, nodes, and administra
 
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Union, Literal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union, Literal
 
-from sqlalchemy import and_, func, or_
+from sqlalchemy import Select, Update, and_, delete, func, lambda_stmt, literal_column, or_, select, update
 from sqlalchemy.orm import Query, Session
 from app.db.models import (
     Admin,
     AdminUsageLogs,
     MasterNodeState,
+    NextPlan,
     Node,
     NodeUsage,
     NodeUserUsage,
@@ -27,13 +28,31 @@ from app.models.user import (
 
 # MasterSettingsService not available in current project structure
 from .common import MASTER_NODE_NAME
-from .node import _ensure_master_state
-from .user import _status_to_str, _ensure_active_user_capacity, get_user_queryset
+from .node import _ensure_master_state, _get_node_lookup, invalidate_node_lookup_cache
+from .user import _ensure_active_user_capacity, _next_plan_table_exists
 from .admin import _maybe_enable_admin_after_data_limit
 
 # ============================================================================
 
 
+def _admin_user_ids_select(admin_id: int) -> Select:
+    """SELECT of the ids of an admin's non-deleted users, for use as an ``IN`` subquery."""
+    return select(User.id).where(User.admin_id == admin_id, User.status != UserStatus.deleted)
+
+
+def _snap_to_hour_bounds(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """
+    Narrow ``[start, end]`` to whole hours without changing which usage rows it matches.
+
+    Usage rows are always written at hour boundaries, so rounding the start up and the end down
+    keeps the filter equivalent while making its parameters stable for every request in the hour.
+    """
+    snapped_start = start.replace(minute=0, second=0, microsecond=0)
+    if snapped_start < start:
+        snapped_start += timedelta(hours=1)
+    return snapped_start, end.replace(minute=0, second=0, microsecond=0)
+
+
 def _get_usage_data(
     db: Session,
     entity_type: Literal["user", "admin", "node", "service", "all_nodes"],
@@ -61,25 +80,25 @@ def _get_usage_data(
 
     # Build base query filter
     user_ids = None
+    user_filter = None
     node_filter = None
-    service_filter = None
-    admin_filter = None
 
     if entity_type == "user" and entity_id:
         user_ids = [entity_id]
+        user_filter = NodeUserUsage.user_id == entity_id
     elif entity_type == "admin":
         if admin:
             entity_id = admin.id
         if entity_id:
-            user_ids = [
-                u.id
-                for u in db.query(User.id).filter(User.admin_id == entity_id).filter(User.status != UserStatus.deleted)
-            ]
+            admin_users = _admin_user_ids_select(entity_id)
+            if not db.execute(select(admin_users.exists())).scalar():
+                return []
+            user_filter = NodeUserUsage.user_id.in_(admin_users)
     elif entity_type == "service":
         if service:
             entity_id = service.id
         if entity_id:
-            service_filter = User.service_id == entity_id
+            user_filter = NodeUserUsage.user_id.in_(select(User.id).where(User.service_id == entity_id))
     elif entity_type == "node":
         if entity_id is not None:
             node_filter = (NodeUserUsage.node_id == entity_id) if entity_id != 0 else NodeUserUsage.node_id.is_(None)
@@ -96,18 +115,13 @@ def _get_usage_data(
 
     # Build query
     query = db.query(NodeUserUsage)
-    if user_ids is not None:
-        if not user_ids:
-            return []
-        query = query.filter(NodeUserUsage.user_id.in_(user_ids))
-    if service_filter:
-        query = query.join(User, User.id == NodeUserUsage.user_id).filter(service_filter)
-    if node_filter:
+    if user_filter is not None:
+        query = query.filter(user_filter)
+    if node_filter is not None:
         query = query.filter(node_filter)
-    if admin_filter:
-        query = query.join(User, User.id == NodeUserUsage.user_id).filter(admin_filter)
 
-    query = query.filter(NodeUserUsage.created_at >= start_aware, NodeUserUsage.created_at <= end_aware)
+    window_start, window_end = _snap_to_hour_bounds(start_aware, end_aware)
+    query = query.filter(NodeUserUsage.created_at >= window_start, NodeUserUsage.created_at <= window_end)
 
     # If using Redis and querying for specific users, try cache first
     if use_redis_cache and user_ids and len(user_ids) == 1 and entity_type == "user":
@@ -120,9 +134,7 @@ def _get_usage_data(
 
     # Get node lookup
     _ensure_master_state(db, for_update=False)
-    node_lookup: Dict[Optional[int], str] = {None: MASTER_NODE_NAME}
-    for node_id, node_name in db.query(Node.id, Node.name).all():
-        node_lookup[node_id] = node_name
+    node_lookup = _get_node_lookup(db)
 
     # Handle different formats
     if format == "timeseries":
@@ -137,6 +149,88 @@ def _get_usage_data(
         return _get_usage_aggregated(query, node_lookup, entity_type == "all_nodes")
 
 
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+# Rows fetched per round trip when usage rows have to be bucketed in Python.
+_FALLBACK_BATCH_SIZE = 10_000
+
+
+# granularity -> (date_trunc unit as a fixed SQL literal, strftime/DATE_FORMAT pattern)
+_BUCKET_SQL = {
+    "hour": ("'hour'", "%Y-%m-%d %H:00:00"),
+    "day": ("'day'", "%Y-%m-%d 00:00:00"),
+}
+
+
+def _bucket_expr(column, granularity: str, dialect_name: str):
+    """Return a SQL expression truncating ``column`` to its hour/day bucket, or None if the dialect is unknown."""
+    if granularity not in _BUCKET_SQL:
+        raise ValueError(f"Unsupported usage granularity: {granularity!r}")
+    unit, fmt = _BUCKET_SQL[granularity]
+    if dialect_name == "postgresql":
+        # A literal rather than a bound parameter, so GROUP BY matches the selected expression
+        return func.date_trunc(literal_column(unit), column)
+    if dialect_name == "sqlite":
+        return func.strftime(fmt, column)
+    if dialect_name in {"mysql", "mariadb"}:
+        return func.date_format(column, fmt)
+    return None
+
+
+def _iter_usage_buckets(
+    query: Query, granularity: str, tz: timezone, by_node: bool
+) -> Iterator[Tuple[datetime, Optional[int], int]]:
+    """
+    Yield ``(bucket_start, node_id, used_traffic)`` for the usage rows matched by ``query``.
+
+    Bucketing and summing happen in SQL when the dialect supports it, so at most one row per
+    bucket (or bucket and node) is returned. ``node_id`` is always None when ``by_node`` is False.
+    """
+    bucket_col = _bucket_expr(NodeUserUsage.created_at, granularity, query.session.get_bind().dialect.name)
+
+    if bucket_col is None:
+        # Bucket by integer step index from the epoch (wall clock in ``tz``) and only build the
+        # datetimes of the buckets that occur, instead of converting every row.
+        step = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+        totals: Dict[Tuple[int, Optional[int]], int] = defaultdict(int)
+        rows = query.with_entities(
+            NodeUserUsage.created_at, NodeUserUsage.node_id, NodeUserUsage.used_traffic
+        ).yield_per(_FALLBACK_BATCH_SIZE)
+        for created_at, node_id, used_traffic in rows:
+            if created_at is None or used_traffic is None:
+                continue
+            if created_at.tzinfo is not None:
+                created_at = created_at.astimezone(tz).replace(tzinfo=None)
+            totals[(created_at - _NAIVE_EPOCH) // step, node_id if by_node else None] += used_traffic
+        for (index, node_id), used_traffic in totals.items():
+            yield (_NAIVE_EPOCH + index * step).replace(tzinfo=tz), node_id, int(used_traffic)
+        return
+
+    bucket_col = bucket_col.label("bucket")
+    traffic_col = func.coalesce(func.sum(NodeUserUsage.used_traffic), 0)
+    if by_node:
+        rows = (
+            query.with_entities(bucket_col, NodeUserUsage.node_id, traffic_col)
+            .group_by(bucket_col, NodeUserUsage.node_id)
+            .all()
+        )
+    else:
+        rows = [
+            (bucket, None, traffic)
+            for bucket, traffic in query.with_entities(bucket_col, traffic_col).group_by(bucket_col).all()
+        ]
+
+    for bucket, node_id, used_traffic in rows:
+        if bucket is None:
+            continue
+        if isinstance(bucket, str):
+            bucket = datetime.strptime(bucket, "%Y-%m-%d %H:%M:%S")
+        if bucket.tzinfo is None:
+            bucket = bucket.replace(tzinfo=tz)
+        else:
+            bucket = bucket.astimezone(tz)
+        yield bucket, node_id, int(used_traffic or 0)
+
+
 def _get_usage_timeseries(
     query: Query,
     start: datetime,
@@ -159,49 +253,33 @@ def _get_usage_timeseries(
     if current > end_aligned:
         return []
 
-    usage_map: Dict[datetime, Dict] = {}
+    totals: Dict[datetime, int] = {}
     cursor = current
     while cursor <= end_aligned:
-        usage_map[cursor] = {"total": 0, "nodes": defaultdict(int)} if include_node_breakdown else {"total": 0}
+        totals[cursor] = 0
         cursor += step
 
-    rows = query.with_entities(NodeUserUsage.created_at, NodeUserUsage.node_id, NodeUserUsage.used_traffic).all()
-
-    for created_at, node_id, used_traffic in rows:
-        if created_at is None or used_traffic is None:
-            continue
-        if created_at.tzinfo is None:
-            created_at = created_at.replace(tzinfo=tz)
-        else:
-            created_at = created_at.astimezone(tz)
-
-        if granularity == "hour":
-            bucket = created_at.replace(minute=0, second=0, microsecond=0)
-        else:
-            bucket = created_at.replace(hour=0, minute=0, second=0, microsecond=0)
-
-        if bucket not in usage_map:
-            usage_map[bucket] = {"total": 0, "nodes": defaultdict(int)} if include_node_breakdown else {"total": 0}
-
-        usage_map[bucket]["total"] += int(used_traffic)
+    # Per-node counters exist only for buckets that have rows, not for every bucket of the skeleton.
+    node_totals: Dict[datetime, Dict[Optional[int], int]] = {}
+    for bucket, node_id, used_traffic in _iter_usage_buckets(query, granularity, tz, include_node_breakdown):
+        totals[bucket] = totals.get(bucket, 0) + used_traffic
         if include_node_breakdown:
-            usage_map[bucket]["nodes"][node_id] += int(used_traffic)
+            bucket_nodes = node_totals.setdefault(bucket, {})
+            bucket_nodes[node_id] = bucket_nodes.get(node_id, 0) + used_traffic
 
     result = []
-    for bucket in sorted(usage_map.keys()):
-        entry = {"timestamp": bucket, "used_traffic": usage_map[bucket]["total"]}
+    for bucket in sorted(totals):
+        entry = {"timestamp": bucket, "used_traffic": totals[bucket]}
         if include_node_breakdown:
-            node_entries = []
-            for nid, usage in usage_map[bucket]["nodes"].items():
-                if usage:
-                    node_entries.append(
-                        {
-                            "node_id": nid if nid is not None else 0,
-                            "node_name": node_lookup.get(nid, MASTER_NODE_NAME),
-                            "used_traffic": int(usage),
-                        }
-                    )
-            entry["nodes"] = node_entries
+            entry["nodes"] = [
+                {
+                    "node_id": nid if nid is not None else 0,
+                    "node_name": node_lookup.get(nid, MASTER_NODE_NAME),
+                    "used_traffic": usage,
+                }
+                for nid, usage in node_totals.get(bucket, {}).items()
+                if usage
+            ]
         result.append(entry)
 
     return result
@@ -220,17 +298,36 @@ def _get_usage_by_nodes(query: Query, node_lookup: Dict[Optional[int], str]) ->
     for node_id, traffic in rows:
         node_usage[node_id] += int(traffic or 0)
 
-    result = []
-    for node_id in sorted(node_usage.keys(), key=lambda x: (x is None, x or -1)):
-        result.append(
-            {
-                "node_id": node_id,
-                "node_name": node_lookup.get(node_id, MASTER_NODE_NAME),
-                "used_traffic": node_usage[node_id],
-            }
-        )
+    return [
+        {
+            "node_id": node_id,
+            "node_name": node_lookup.get(node_id, MASTER_NODE_NAME),
+            "used_traffic": node_usage[node_id],
+        }
+        for node_id in _node_order(node_usage, node_lookup, master_last=True)
+    ]
 
-    return result
+
+def _node_order(
+    node_ids: Iterable[Optional[int]], node_lookup: Dict[Optional[int], str], master_last: bool = False
+) -> List[Optional[int]]:
+    """
+    Order ``node_ids`` with the master (``None``) first, or last, then by ascending node id.
+
+    The cached node lookup is already kept in that order, so it is reused unless an id is
+    missing from it (e.g. usage of a node removed since the lookup was loaded).
+    """
+    present = set(node_ids)
+    if present <= node_lookup.keys():
+        ordered = [node_id for node_id in node_lookup if node_id is not None and node_id in present]
+    else:
+        ordered = sorted(node_id for node_id in present if node_id is not None)
+    if None in present:
+        if master_last:
+            ordered.append(None)
+        else:
+            ordered.insert(0, None)
+    return ordered
 
 
 def _get_usage_by_day(query: Query, start: datetime, end: datetime, granularity: str) -> List[Dict]:
@@ -238,36 +335,23 @@ def _get_usage_by_day(query: Query, start: datetime, end: datetime, granularity:
     if granularity == "hour":
         current = start.replace(minute=0, second=0, microsecond=0)
         end_aligned = end.replace(minute=0, second=0, microsecond=0)
-        step = timedelta(hours=1)
         fmt = "%Y-%m-%d %H:00"
     else:
         current = start.replace(hour=0, minute=0, second=0, microsecond=0)
         end_aligned = end.replace(hour=0, minute=0, second=0, microsecond=0)
-        step = timedelta(days=1)
         fmt = "%Y-%m-%d"
 
     if current > end_aligned:
         return []
 
-    usage_by_date: Dict[str, int] = {}
-    while current <= end_aligned:
-        label = current.strftime(fmt)
-        usage_by_date[label] = 0
-        current += step
-
-    rows = query.with_entities(NodeUserUsage.created_at, NodeUserUsage.used_traffic).all()
-
-    for created_at, used_traffic in rows:
-        if created_at is None:
-            continue
-        bucket_time = created_at
-        if granularity == "hour":
-            bucket_time = bucket_time.replace(minute=0, second=0, microsecond=0)
-        else:
-            bucket_time = bucket_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Empty buckets are dropped from the result, so only buckets that have rows are materialized.
+    # The labels sort chronologically, which keeps the window check independent of tz-awareness.
+    first_label, last_label = current.strftime(fmt), end_aligned.strftime(fmt)
+    usage_by_date: Dict[str, int] = defaultdict(int)
+    for bucket_time, _, used_traffic in _iter_usage_buckets(query, granularity, timezone.utc, False):
         label = bucket_time.strftime(fmt)
-        if label in usage_by_date:
-            usage_by_date[label] += int(used_traffic or 0)
+        if first_label <= label <= last_label:
+            usage_by_date[label] += used_traffic
 
     return [{"date": label, "used_traffic": usage} for label, usage in sorted(usage_by_date.items()) if usage > 0]
 
@@ -291,11 +375,14 @@ def _get_usage_aggregated(
             if node_id is not None:
                 usages[node_id] = UserUsageResponse(node_id=node_id, node_name=node_lookup[node_id], used_traffic=0)
 
-        rows = query.all()
-        for v in rows:
-            node_key = v.node_id if v.node_id is not None else None
-            if node_key in usages:
-                usages[node_key].used_traffic += int(v.used_traffic or 0)
+        rows = (
+            query.with_entities(NodeUserUsage.node_id, func.coalesce(func.sum(NodeUserUsage.used_traffic), 0))
+            .group_by(NodeUserUsage.node_id)
+            .all()
+        )
+        for node_id, traffic in rows:
+            if node_id in usages:
+                usages[node_id].used_traffic += int(traffic or 0)
 
         return list(usages.values())
 
@@ -318,11 +405,8 @@ def get_user_usage_timeseries(
         format="timeseries",
         include_node_breakdown=True,
     )
-    # Convert to expected format with 'total' field
+    # Convert to expected format with 'total' field; node names were already resolved by _get_usage_data
     master = _ensure_master_state(db, for_update=False)
-    node_lookup: Dict[Optional[int], str] = {None: MASTER_NODE_NAME}
-    for node_id, node_name in db.query(Node.id, Node.name).all():
-        node_lookup[node_id] = node_name
 
     timeline = []
     for entry in result:
@@ -333,7 +417,7 @@ def get_user_usage_timeseries(
             node_entries.append(
                 {
                     "node_id": resolved_id,
-                    "node_name": node_lookup.get(nid) or node_lookup.get(None, "Master"),
+                    "node_name": node_info["node_name"],
                     "used_traffic": node_info["used_traffic"],
                 }
             )
@@ -341,6 +425,31 @@ def get_user_usage_timeseries(
     return timeline
 
 
+def _node_downlink_entries(
+    node_lookup: Dict[Optional[int], str], by_nodes: List[Dict], include_idle: bool = True
+) -> Dict[Optional[int], Dict]:
+    """
+    Shape grouped ``by_nodes`` usage rows as ``{node_id: {node_id, node_name, uplink, downlink}}``.
+
+    Rows are already summed per node, so each one is assigned rather than accumulated. With
+    ``include_idle`` every node in ``node_lookup`` is present, with zero usage if it had no rows.
+    """
+    entries: Dict[Optional[int], Dict] = {}
+    if include_idle:
+        for node_id, node_name in node_lookup.items():
+            entries[node_id] = {"node_id": node_id, "node_name": node_name, "uplink": 0, "downlink": 0}
+
+    for row in by_nodes:
+        nid = row["node_id"]
+        entries[nid] = {
+            "node_id": nid,
+            "node_name": node_lookup.get(nid) or (MASTER_NODE_NAME if nid is None else f"Node {nid}"),
+            "uplink": 0,
+            "downlink": row["used_traffic"],
+        }
+    return entries
+
+
 def get_user_usage_by_nodes(
     db: Session,
     dbuser: User,
@@ -349,24 +458,10 @@ def get_user_usage_by_nodes(
 ) -> List[Dict[str, Union[Optional[int], str, int]]]:
     """Aggregate total usage per node (downlink) for a user within a date range."""
     result = _get_usage_data(db=db, entity_type="user", entity_id=dbuser.id, start=start, end=end, format="by_nodes")
-    # Convert to expected format with uplink/downlink
-    node_lookup: Dict[Optional[int], Dict] = {}
-    for node in db.query(Node).all():
-        node_lookup[node.id] = {"node_id": node.id, "node_name": node.name, "uplink": 0, "downlink": 0}
-    node_lookup[None] = {"node_id": None, "node_name": MASTER_NODE_NAME, "uplink": 0, "downlink": 0}
-
-    for entry in result:
-        nid = entry["node_id"]
-        if nid not in node_lookup:
-            node_lookup[nid] = {
-                "node_id": nid,
-                "node_name": MASTER_NODE_NAME if nid is None else f"Node {nid}",
-                "uplink": 0,
-                "downlink": 0,
-            }
-        node_lookup[nid]["downlink"] += entry["used_traffic"]
-
-    return sorted(node_lookup.values(), key=lambda e: (e["node_id"] is not None, e["node_id"] or -1))
+    # Every known node is reported, idle ones with zero usage
+    node_lookup = _get_node_lookup(db)
+    usages = _node_downlink_entries(node_lookup, result)
+    return [usages[node_id] for node_id in _node_order(usages, node_lookup)]
 
 
 def get_user_usages(db: Session, dbuser: User, start: datetime, end: datetime) -> List[UserUsageResponse]:
@@ -406,7 +501,7 @@ def reset_user_data_usage(db: Session, dbuser: User) -> User:
 
     # Refresh user state to ensure we have latest data
     if user_state.persistent:
-        db.refresh(dbuser, ["used_traffic", "status", "node_usages", "next_plan"])
+        db.refresh(dbuser, ["used_traffic", "status", "next_plan"])
 
     usage_log = UserUsageResetLogs(
         user=dbuser,
@@ -415,20 +510,15 @@ def reset_user_data_usage(db: Session, dbuser: User) -> User:
     db.add(usage_log)
 
     dbuser.used_traffic = 0
-    dbuser.node_usages.clear()
-    current_status_value = _status_to_str(dbuser.status)
-    should_activate = current_status_value not in (
-        UserStatus.expired.value,
-        UserStatus.disabled.value,
-    )
-    if should_activate:
-        if current_status_value != UserStatus.active.value:
+    db.query(NodeUserUsage).filter(NodeUserUsage.user_id == dbuser.id).delete(synchronize_session=False)
+    if dbuser.status not in (UserStatus.expired, UserStatus.disabled):
+        if dbuser.status != UserStatus.active:
             _ensure_active_user_capacity(
                 db,
                 dbuser.admin,
                 exclude_user_ids=(dbuser.id,),
             )
-        dbuser.status = UserStatus.active.value
+        dbuser.status = UserStatus.active
 
     if dbuser.next_plan:
         db.delete(dbuser.next_plan)
@@ -461,33 +551,31 @@ def reset_all_users_data_usage(db: Session, admin: Optional[Admin] = None):
         db (Session): Database session.
         admin (Optional[Admin]): Admin to filter users by, if any.
     """
-    query = get_user_queryset(db)
-
+    users_query = db.query(User).filter(User.status != UserStatus.deleted)
     if admin:
-        query = query.filter(User.admin == admin)
-
-    for dbuser in query.all():
-        dbuser.used_traffic = 0
-        current_status_value = _status_to_str(dbuser.status)
-        should_activate = current_status_value not in (
-            UserStatus.on_hold.value,
-            UserStatus.expired.value,
-            UserStatus.disabled.value,
-        )
-        if should_activate:
-            if current_status_value != UserStatus.active.value:
-                _ensure_active_user_capacity(
-                    db,
-                    dbuser.admin,
-                    exclude_user_ids=(dbuser.id,),
-                )
-            dbuser.status = UserStatus.active
-        dbuser.usage_logs.clear()
-        dbuser.node_usages.clear()
-        if dbuser.next_plan:
-            db.delete(dbuser.next_plan)
-            dbuser.next_plan = None
-        db.add(dbuser)
+        users_query = users_query.filter(User.admin_id == admin.id)
+    user_ids = users_query.with_entities(User.id).scalar_subquery()
+    # Probe before writing: the inspector checks out its own connection.
+    has_next_plan_table = _next_plan_table_exists(db)
+
+    # Of the statuses that get reactivated, only limited users actually change. The capacity check
+    # is evaluated once per owning admin, exactly as the former per-user check saw the database.
+    limited_users = users_query.filter(User.status == UserStatus.limited)
+    owner_ids = {owner_id for (owner_id,) in limited_users.with_entities(User.admin_id).distinct()}
+    owner_ids.discard(None)
+    if owner_ids:
+        for owner in db.query(Admin).filter(Admin.id.in_(owner_ids)):
+            _ensure_active_user_capacity(db, owner)
+
+    db.query(NodeUserUsage).filter(NodeUserUsage.user_id.in_(user_ids)).delete(synchronize_session=False)
+    # usage_logs has no delete-orphan cascade: clearing the collection used to detach the rows, not delete them.
+    db.query(UserUsageResetLogs).filter(UserUsageResetLogs.user_id.in_(user_ids)).update(
+        {UserUsageResetLogs.user_id: None}, synchronize_session=False
+    )
+    if has_next_plan_table:
+        db.query(NextPlan).filter(NextPlan.user_id.in_(user_ids)).delete(synchronize_session=False)
+    limited_users.update({User.status: UserStatus.active}, synchronize_session=False)
+    users_query.update({User.used_traffic: 0}, synchronize_session=False)
 
     db.commit()
 
@@ -534,21 +622,46 @@ def reset_admin_usage(db: Session, dbadmin: Admin) -> int:
     return dbadmin
 
 
+def _reset_usage_rows(db: Session, node_usage_filter, node_user_usage_filter, state_reset: Update) -> None:
+    """
+    Delete the matching NodeUsage/NodeUserUsage rows and apply ``state_reset`` in one transaction.
+
+    PostgreSQL runs the deletes as data-modifying CTEs of the UPDATE, i.e. one statement and one
+    round trip; other dialects execute the three statements in turn.
+    """
+    deletes = (
+        delete(NodeUsage).where(node_usage_filter),
+        delete(NodeUserUsage).where(node_user_usage_filter),
+    )
+    options = {"synchronize_session": False}
+    if db.get_bind().dialect.name == "postgresql":
+        for index, stmt in enumerate(deletes):
+            state_reset = state_reset.add_cte(stmt.cte(f"reset_usage_{index}"))
+        db.execute(state_reset, execution_options=options)
+        return
+
+    for stmt in deletes:
+        db.execute(stmt, execution_options=options)
+    db.execute(state_reset, execution_options=options)
+
+
 def reset_master_usage(db: Session) -> MasterNodeState:
     master_state = _ensure_master_state(db, for_update=True)
 
-    db.query(NodeUsage).filter(or_(NodeUsage.node_id.is_(None), NodeUsage.node_id == master_state.id)).delete(
-        synchronize_session=False
+    _reset_usage_rows(
+        db,
+        or_(NodeUsage.node_id.is_(None), NodeUsage.node_id == master_state.id),
+        or_(NodeUserUsage.node_id.is_(None), NodeUserUsage.node_id == master_state.id),
+        update(MasterNodeState)
+        .where(MasterNodeState.id == master_state.id)
+        .values(
+            uplink=0,
+            downlink=0,
+            status=NodeStatus.connected,
+            message=None,
+            updated_at=datetime.now(timezone.utc),
+        ),
     )
-    db.query(NodeUserUsage).filter(
-        or_(NodeUserUsage.node_id.is_(None), NodeUserUsage.node_id == master_state.id)
-    ).delete(synchronize_session=False)
-
-    master_state.uplink = 0
-    master_state.downlink = 0
-    master_state.status = NodeStatus.connected
-    master_state.message = None
-    master_state.updated_at = datetime.now(timezone.utc)
 
     db.commit()
     db.refresh(master_state)
@@ -578,27 +691,39 @@ def get_nodes_usage(db: Session, start: datetime, end: datetime) -> List[NodeUsa
         )
     }
 
-    for node in db.query(Node).all():
-        usages[node.id] = NodeUsageResponse(
-            node_id=node.id,
-            node_name=node.name,
-            uplink=0,
-            downlink=0,
-        )
+    for node_id, node_name in _get_node_lookup(db).items():
+        if node_id is not None:
+            usages[node_id] = NodeUsageResponse(
+                node_id=node_id,
+                node_name=node_name,
+                uplink=0,
+                downlink=0,
+            )
 
-    cond = and_(NodeUsage.created_at >= start, NodeUsage.created_at <= end)
+    # The statement shape never changes, so build it once; start/end are re-bound on every call.
+    stmt = lambda_stmt(
+        lambda: select(
+            NodeUsage.node_id,
+            func.coalesce(func.sum(NodeUsage.uplink), 0),
+            func.coalesce(func.sum(NodeUsage.downlink), 0),
+        )
+        .where(NodeUsage.created_at >= start, NodeUsage.created_at <= end)
+        .group_by(NodeUsage.node_id)
+    )
 
-    for entry in db.query(NodeUsage).filter(cond):
-        target_id = entry.node_id
-        if target_id not in usages:
+    # One row per node: the sums replace the zero placeholders instead of being accumulated.
+    for target_id, uplink, downlink in db.execute(stmt):
+        entry = usages.get(target_id)
+        if entry is None:
             usages[target_id] = NodeUsageResponse(
                 node_id=target_id,
-                node_name=MASTER_NODE_NAME if target_id is None else f"Node {target_id}",
-                uplink=0,
-                downlink=0,
+                node_name=f"Node {target_id}",
+                uplink=int(uplink or 0),
+                downlink=int(downlink or 0),
             )
-        usages[target_id].uplink += entry.uplink
-        usages[target_id].downlink += entry.downlink
+        else:
+            entry.uplink = int(uplink or 0)
+            entry.downlink = int(downlink or 0)
 
     return list(usages.values())
 
@@ -614,14 +739,17 @@ def reset_node_usage(db: Session, dbnode: Node) -> Node:
     Returns:
         Node: The updated node object.
     """
-    db.query(NodeUsage).filter(NodeUsage.node_id == dbnode.id).delete(synchronize_session=False)
-    db.query(NodeUserUsage).filter(NodeUserUsage.node_id == dbnode.id).delete(synchronize_session=False)
+    _reset_usage_rows(
+        db,
+        NodeUsage.node_id == dbnode.id,
+        NodeUserUsage.node_id == dbnode.id,
+        update(Node)
+        .where(Node.id == dbnode.id)
+        .values(uplink=0, downlink=0, status=NodeStatus.connected, message=None),
+    )
 
-    dbnode.uplink = 0
-    dbnode.downlink = 0
-    dbnode.status = NodeStatus.connected
-    dbnode.message = None
     db.commit()
+    invalidate_node_lookup_cache()
     db.refresh(dbnode)
     return dbnode
 
@@ -657,14 +785,12 @@ def get_admin_usages_by_day(
     Supports daily (default) or hourly granularity.
     """
     # Note: node_id filter not yet supported in _get_usage_data, using direct query for now
-    user_ids = [
-        u.id for u in db.query(User.id).filter(User.admin_id == dbadmin.id).filter(User.status != UserStatus.deleted)
-    ]
-    if not user_ids:
+    admin_users = _admin_user_ids_select(dbadmin.id)
+    if not db.execute(select(admin_users.exists())).scalar():
         return []
 
     query = db.query(NodeUserUsage).filter(
-        NodeUserUsage.user_id.in_(user_ids), NodeUserUsage.created_at >= start, NodeUserUsage.created_at <= end
+        NodeUserUsage.user_id.in_(admin_users), NodeUserUsage.created_at >= start, NodeUserUsage.created_at <= end
     )
     if node_id is not None:
         if node_id == 0:
@@ -697,23 +823,7 @@ def get_admin_usage_by_nodes(db: Session, dbadmin: Admin, start: datetime, end:
     grouped by node. Returns a list of dictionaries with node_id, node_name, uplink, and downlink.
     """
     result = _get_usage_data(db=db, entity_type="admin", admin=dbadmin, start=start, end=end, format="by_nodes")
-    # Convert to expected format with uplink/downlink
-    node_lookup: Dict[Optional[int], Dict] = {}
-    for node in db.query(Node).all():
-        node_lookup[node.id] = {"node_id": node.id, "node_name": node.name, "uplink": 0, "downlink": 0}
-    node_lookup[None] = {"node_id": None, "node_name": "Master", "uplink": 0, "downlink": 0}
-
-    for entry in result:
-        nid = entry["node_id"]
-        if nid not in node_lookup:
-            node_lookup[nid] = {
-                "node_id": nid,
-                "node_name": "Master" if nid is None else f"Node {nid}",
-                "uplink": 0,
-                "downlink": 0,
-            }
-        node_lookup[nid]["downlink"] += entry["used_traffic"]
-
-    return sorted(
-        [e for e in node_lookup.values() if e["uplink"] > 0 or e["downlink"] > 0], key=lambda x: x["node_id"] or 0
-    )
+    # Only nodes with traffic are reported, so nothing needs to be seeded from the node lookup
+    node_lookup = _get_node_lookup(db)
+    usages = _node_downlink_entries(node_lookup, result, include_idle=False)
+    return [usages[node_id] for node_id in _node_order(usages, node_lookup) if usages[node_id]["downlink"] > 0]
@@ -4,12 +4,16 @@ Functions for managing proxy hosts, users, user templates, nodes, and administra
 
 import logging
 import json
+import re
 from datetime import datetime, timedelta, timezone
 from enum import Enum
+from functools import cmp_to_key, lru_cache
 import uuid
-from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+import weakref
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
 
-from sqlalchemy import and_, exists, func, or_, inspect
+from sqlalchemy import Select, and_, bindparam, case, delete, exists, func, inspect, literal_column, or_, select, update
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import DataError, IntegrityError, OperationalError
 from sqlalchemy.orm import Query, Session, joinedload, selectinload
 from sqlalchemy.sql.functions import coalesce
@@ -24,15 +28,18 @@ from app.db.models import (
     User,
     UserTemplate,
     UserUsageResetLogs,
+    excluded_inbounds_association,
+    template_inbounds_association,
 )
-from .proxy import get_or_create_inbound, _apply_key_to_existing_proxies
+from .proxy import get_or_create_inbounds, _apply_key_to_existing_proxies
 from .common import _is_record_changed_error, _ensure_user_deleted_status
 
 # _apply_service_to_user imported inside functions to avoid circular import
 from app.utils.credentials import (
+    _as_proxy_type,
     generate_key,
     serialize_proxy_settings,
-    uuid_to_key,
+    uuid_to_keys,
     UUID_PROTOCOLS,
     PASSWORD_PROTOCOLS,
 )
@@ -59,6 +66,12 @@ _logger = logging.getLogger(__name__)
 _RECORD_CHANGED_ERRNO = 1020
 ADMIN_DATA_LIMIT_EXHAUSTED_REASON_KEY = "admin_data_limit_exhausted"
 
+# Users hydrated per window when get_users returns an unpaginated listing from the database.
+_USERS_LIST_WINDOW_SIZE = 1000
+
+# Engines already known to have the next_plans table, so the schema is inspected once per engine.
+_NEXT_PLAN_TABLE_ENGINES: "weakref.WeakKeyDictionary[Engine, bool]" = weakref.WeakKeyDictionary()
+
 # ============================================================================
 
 
@@ -72,10 +85,12 @@ def get_user_queryset(db: Session, eager_load: bool = True) -> Query:
         from app.db.models import Service
 
         options = [
-            joinedload(User.admin),  # many-to-one: one admin per user
-            joinedload(User.service).joinedload(
-                Service.host_links
-            ),  # many-to-one: one service per user, with host_links for service_host_orders
+            # many-to-one, but shared by many users: one IN query per distinct admin instead of
+            # repeating the admin row on every user row
+            selectinload(User.admin),
+            # many-to-one: one service per user; its host_links (for service_host_orders) are a
+            # collection, loaded in one IN query instead of multiplying every user row per link
+            joinedload(User.service).selectinload(Service.host_links),
             selectinload(User.proxies).selectinload(Proxy.excluded_inbounds),
             selectinload(User.usage_logs),  # one-to-many: for lifetime_used_traffic
         ]
@@ -123,11 +138,19 @@ def _next_plan_table_exists(db: Session) -> bool:
     bind = db.get_bind()
     if bind is None:
         return False
+    engine = bind if isinstance(bind, Engine) else bind.engine
+    # Only a positive answer is remembered: the table is never dropped at runtime, but it may be
+    # created by a migration after the first check.
+    if _NEXT_PLAN_TABLE_ENGINES.get(engine):
+        return True
     try:
         inspector = inspect(bind)
-        return inspector.has_table("next_plans")
+        found = inspector.has_table("next_plans")
     except Exception:
         return False
+    if found:
+        _NEXT_PLAN_TABLE_ENGINES[engine] = True
+    return found
 
 
 def get_user(db: Session, username: Optional[str] = None, user_id: Optional[int] = None) -> Optional[User]:
@@ -137,16 +160,16 @@ def get_user(db: Session, username: Optional[str] = None, user_id: Optional[int]
         from app.redis.cache import get_cached_user
 
         cached_user = get_cached_user(username=username, user_id=user_id, db=db)
-        if cached_user:
-            # Refresh from DB to get latest relationships
-            query = get_user_queryset(db)
-            if user_id is not None:
-                db_user = query.filter(User.id == user_id).first()
-            elif username:
-                normalized = username.lower()
-                db_user = query.filter(func.lower(User.username) == normalized).first()
-            else:
-                db_user = None
+        if cached_user is not None and cached_user in db:
+            # A cache miss: get_cached_user already loaded (and re-cached) the row from this session.
+            # Its lookup by id does not skip soft-deleted users, so those fall through to the query below.
+            if cached_user.status != UserStatus.deleted:
+                return cached_user
+        elif cached_user:
+            # Cache hit: callers mutate the result, so return the session-bound row, found by primary key
+            db_user = None
+            if cached_user.id is not None:
+                db_user = get_user_queryset(db).filter(User.id == cached_user.id).first()
 
             if db_user:
                 # Update cache with fresh data and return
@@ -185,26 +208,40 @@ def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
     return get_user(db, user_id=user_id)
 
 
+_SORT_COLUMNS = {
+    "username": User.username,
+    "used_traffic": User.used_traffic,
+    "data_limit": User.data_limit,
+    "expire": User.expire,
+    "created_at": User.created_at,
+}
+
+# Plain string members; the ORDER BY clause for an option is built by _sort_clause when a query needs it.
 UsersSortingOptions = Enum(
     "UsersSortingOptions",
-    {
-        "username": User.username.asc(),
-        "used_traffic": User.used_traffic.asc(),
-        "data_limit": User.data_limit.asc(),
-        "expire": User.expire.asc(),
-        "created_at": User.created_at.asc(),
-        "-username": User.username.desc(),
-        "-used_traffic": User.used_traffic.desc(),
-        "-data_limit": User.data_limit.desc(),
-        "-expire": User.expire.desc(),
-        "-created_at": User.created_at.desc(),
-    },
+    {name: name for name in (*_SORT_COLUMNS, *(f"-{column}" for column in _SORT_COLUMNS))},
+    type=str,
 )
 
+
+def _sort_clause(option: UsersSortingOptions):
+    """Return the ORDER BY expression for a sort option (a leading ``-`` means descending)."""
+    column = _SORT_COLUMNS[option.value.lstrip("-")]
+    return column.desc() if option.value.startswith("-") else column.asc()
+
+
 ONLINE_ACTIVE_WINDOW = timedelta(minutes=5)
 OFFLINE_STALE_WINDOW = timedelta(hours=24)
 UPDATE_STALE_WINDOW = timedelta(hours=24)
-_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+@lru_cache(maxsize=4)
+def _activity_thresholds(now: datetime) -> Tuple[datetime, datetime, datetime]:
+    """Online, offline and subscription-update cut-offs for ``now`` (truncated to the second by callers)."""
+    return now - ONLINE_ACTIVE_WINDOW, now - OFFLINE_STALE_WINDOW, now - UPDATE_STALE_WINDOW
+
+
+_UUID_HEX_RE = re.compile(r"[0-9a-f]{32}")
 
 STATUS_FILTER_MAP = {
     "expired": UserStatus.expired,
@@ -214,33 +251,38 @@ STATUS_FILTER_MAP = {
 }
 
 
-def _derive_search_tokens(value: str) -> Tuple[Set[str], Set[str]]:
+@lru_cache(maxsize=1024)
+def _parse_search_uuid(value: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """Credential keys and UUIDs ``value`` spells out directly; pure parsing, so safe to cache."""
     normalized = value.strip().lower()
     if not normalized:
-        return set(), set()
+        return frozenset(), frozenset()
 
-    key_candidates: Set[str] = set()
-    uuid_candidates: Set[str] = set()
     cleaned = normalized.replace("-", "")
+    if _UUID_HEX_RE.fullmatch(cleaned):
+        return frozenset({cleaned}), frozenset({str(uuid.UUID(cleaned))})
 
-    if len(cleaned) == 32 and all(ch in _HEX_DIGITS for ch in cleaned):
-        key_candidates.add(cleaned)
-        try:
-            uuid_candidates.add(str(uuid.UUID(cleaned)))
-        except ValueError:
-            pass
-    try:
-        parsed = uuid.UUID(normalized)
-        uuid_candidates.add(str(parsed))
-    except ValueError:
-        pass
+    # Same normalization uuid.UUID() applies, so plain-text searches never reach its ValueError path.
+    hex_digits = normalized.replace("urn:", "").replace("uuid:", "").strip("{}").replace("-", "")
+    if not _UUID_HEX_RE.fullmatch(hex_digits):
+        return frozenset(), frozenset()
+    return frozenset(), frozenset({str(uuid.UUID(hex_digits))})
 
-    for candidate in list(uuid_candidates):
-        for proxy_type in UUID_PROTOCOLS:
-            try:
-                key_candidates.add(uuid_to_key(candidate, proxy_type))
-            except Exception:
-                continue
+
+def _derive_search_tokens(value: str) -> Tuple[Set[str], FrozenSet[str]]:
+    """Credential keys and UUIDs a search may refer to.
+
+    The keys derived through the UUID masks depend on database state, so only the parsing is cached.
+    """
+    direct_keys, uuid_candidates = _parse_search_uuid(value)
+    key_candidates: Set[str] = set(direct_keys)
+
+    # Every candidate is a well-formed UUID here; the masks are read once per candidate, not per protocol
+    for candidate in uuid_candidates:
+        try:
+            key_candidates.update(uuid_to_keys(candidate, UUID_PROTOCOLS))
+        except Exception:
+            continue
 
     return key_candidates, uuid_candidates
 
@@ -255,16 +297,15 @@ def _apply_advanced_user_filters(
     normalized_filters = {f.lower() for f in filters if f}
     if not normalized_filters:
         return query
+    online_threshold, offline_threshold, update_threshold = _activity_thresholds(now.replace(microsecond=0))
 
     if "online" in normalized_filters:
-        online_threshold = now - ONLINE_ACTIVE_WINDOW
         query = query.filter(
             User.online_at.isnot(None),
             User.online_at >= online_threshold,
         )
 
     if "offline" in normalized_filters:
-        offline_threshold = now - OFFLINE_STALE_WINDOW
         query = query.filter(
             or_(
                 User.online_at.is_(None),
@@ -282,7 +323,6 @@ def _apply_advanced_user_filters(
         query = query.filter(or_(User.data_limit.is_(None), User.data_limit == 0))
 
     if "sub_not_updated" in normalized_filters:
-        update_threshold = now - UPDATE_STALE_WINDOW
         query = query.filter(
             or_(
                 User.sub_updated_at.is_(None),
@@ -300,6 +340,92 @@ def _apply_advanced_user_filters(
     return query
 
 
+_MIN_AWARE_DATETIME = datetime.min.replace(tzinfo=timezone.utc)
+
+# Sort keys for cached users, matching the columns behind UsersSortingOptions.
+_CACHED_SORT_KEYS: Dict[str, Callable[[User], Any]] = {
+    "username": lambda u: (u.username or "").lower(),
+    "used_traffic": lambda u: getattr(u, "used_traffic", 0) or 0,
+    "data_limit": lambda u: u.data_limit or 0,
+    "expire": lambda u: u.expire or _MIN_AWARE_DATETIME,
+    "created_at": lambda u: u.created_at or _MIN_AWARE_DATETIME,
+}
+
+
+def _sort_cached_users(users: List[User], sort: List[UsersSortingOptions]) -> None:
+    """Sort cached users in place by ``sort`` (most significant option first) in a single pass."""
+    key_specs = [(_CACHED_SORT_KEYS[opt.value.lstrip("-")], opt.value.startswith("-")) for opt in sort]
+    if not key_specs:
+        return
+
+    if len({reverse for _, reverse in key_specs}) == 1:
+        getters = [getter for getter, _ in key_specs]
+        if len(getters) == 1:
+            key = getters[0]
+        else:
+
+            def key(u: User) -> tuple:
+                return tuple(getter(u) for getter in getters)
+
+        users.sort(key=key, reverse=key_specs[0][1])
+        return
+
+    # Mixed directions: strings and datetimes cannot be negated, so compare field by field.
+    def compare(a: User, b: User) -> int:
+        for getter, reverse in key_specs:
+            left, right = getter(a), getter(b)
+            if left != right:
+                result = -1 if left < right else 1
+                return -result if reverse else result
+        return 0
+
+    users.sort(key=cmp_to_key(compare))
+
+
+def _search_predicate(search: str) -> Callable[[User], bool]:
+    """Return a predicate matching cached users against ``search`` the way the DB query does."""
+    search_lower = search.lower()
+    key_candidates, uuid_candidates = _derive_search_tokens(search)
+
+    def matches_search(u: User) -> bool:
+        if u.username and search_lower in u.username.lower():
+            return True
+        if u.note and search_lower in u.note.lower():
+            return True
+        if u.credential_key:
+            if search_lower in u.credential_key.lower():
+                return True
+            if key_candidates:
+                normalized_key = u.credential_key.replace("-", "").lower()
+                if normalized_key in key_candidates:
+                    return True
+        if not uuid_candidates:
+            return False
+        # Users deserialized from Redis carry their proxy UUIDs precomputed
+        proxy_ids = getattr(u, "_proxy_ids", None)
+        if proxy_ids is not None:
+            return not uuid_candidates.isdisjoint(proxy_ids)
+        if hasattr(u, "proxies") and u.proxies:
+            for proxy in u.proxies:
+                # Handle both dict and string settings
+                if isinstance(proxy.settings, dict):
+                    proxy_id = proxy.settings.get("id")
+                elif isinstance(proxy.settings, str):
+                    try:
+                        proxy_settings = json.loads(proxy.settings)
+                        proxy_id = proxy_settings.get("id") if isinstance(proxy_settings, dict) else None
+                    except Exception:
+                        proxy_id = None
+                else:
+                    proxy_id = None
+
+                if proxy_id and proxy_id in uuid_candidates:
+                    return True
+        return False
+
+    return matches_search
+
+
 def _filter_users_in_memory(
     users: List[User],
     usernames: Optional[List[str]] = None,
@@ -316,135 +442,173 @@ def _filter_users_in_memory(
     if now is None:
         now = datetime.now(timezone.utc)
 
-    # Always exclude deleted users to keep cache results consistent with DB queries
-    filtered = [u for u in users if getattr(u, "status", None) != UserStatus.deleted]
+    # Every requested filter becomes one predicate, so the list is walked once instead of once per filter
+    predicates: List[Callable[[User], bool]] = []
 
-    # Filter by usernames
     if usernames:
         username_set = {u.lower() for u in usernames}
-        filtered = [u for u in filtered if u.username and u.username.lower() in username_set]
+        predicates.append(lambda u: bool(u.username) and u.username.lower() in username_set)
 
-    # Filter by status
     if status:
         if isinstance(status, list):
             status_set = set(status)
-            filtered = [u for u in filtered if u.status in status_set]
+            predicates.append(lambda u: u.status in status_set)
         else:
-            filtered = [u for u in filtered if u.status == status]
+            predicates.append(lambda u: u.status == status)
 
-    # Filter by service_id
     if service_id is not None:
-        filtered = [u for u in filtered if u.service_id == service_id]
+        predicates.append(lambda u: u.service_id == service_id)
 
-    # Filter by reset_strategy
     if reset_strategy:
         if isinstance(reset_strategy, list):
             strategy_set = {s.value if hasattr(s, "value") else s for s in reset_strategy}
-            filtered = [
-                u for u in filtered if u.data_limit_reset_strategy and u.data_limit_reset_strategy.value in strategy_set
-            ]
         else:
-            strategy_value = reset_strategy.value if hasattr(reset_strategy, "value") else reset_strategy
-            filtered = [
-                u
-                for u in filtered
-                if u.data_limit_reset_strategy and u.data_limit_reset_strategy.value == strategy_value
-            ]
+            strategy_set = {reset_strategy.value if hasattr(reset_strategy, "value") else reset_strategy}
+        predicates.append(
+            lambda u: bool(u.data_limit_reset_strategy) and u.data_limit_reset_strategy.value in strategy_set
+        )
 
-    # Filter by admin
     if admin and hasattr(admin, "id") and admin.id is not None:
         admin_id = int(admin.id)
-        filtered = [u for u in filtered if u.admin_id is not None and int(u.admin_id) == admin_id]
+        predicates.append(lambda u: u.admin_id is not None and int(u.admin_id) == admin_id)
 
-    # Filter by admins
     if admins:
         admin_set = {a.lower() for a in admins}
-        filtered = [
-            u
-            for u in filtered
-            if (
-                (
-                    getattr(u, "admin", None)
-                    and getattr(u.admin, "username", None)
-                    and u.admin.username.lower() in admin_set
-                )
-                or (getattr(u, "admin_username", None) and u.admin_username.lower() in admin_set)
-            )
-        ]
 
-    # Apply advanced filters
+        def matches_admins(u: User) -> bool:
+            admin_obj = getattr(u, "admin", None)
+            if admin_obj and getattr(admin_obj, "username", None) and admin_obj.username.lower() in admin_set:
+                return True
+            admin_username = getattr(u, "admin_username", None)
+            return bool(admin_username) and admin_username.lower() in admin_set
+
+        predicates.append(matches_admins)
+
     if advanced_filters:
         normalized_filters = {f.lower() for f in advanced_filters if f}
+        online_threshold, offline_threshold, update_threshold = _activity_thresholds(now.replace(microsecond=0))
 
         if "online" in normalized_filters:
-            online_threshold = now - ONLINE_ACTIVE_WINDOW
-            filtered = [u for u in filtered if u.online_at and u.online_at >= online_threshold]
+            predicates.append(lambda u: bool(u.online_at) and u.online_at >= online_threshold)
 
         if "offline" in normalized_filters:
-            offline_threshold = now - OFFLINE_STALE_WINDOW
-            filtered = [u for u in filtered if not u.online_at or u.online_at < offline_threshold]
+            predicates.append(lambda u: not u.online_at or u.online_at < offline_threshold)
 
         if "finished" in normalized_filters:
-            filtered = [u for u in filtered if u.status in (UserStatus.limited, UserStatus.expired)]
+            predicates.append(lambda u: u.status in (UserStatus.limited, UserStatus.expired))
 
         if "limit" in normalized_filters:
-            filtered = [u for u in filtered if u.data_limit and u.data_limit > 0]
+            predicates.append(lambda u: bool(u.data_limit) and u.data_limit > 0)
 
         if "unlimited" in normalized_filters:
-            filtered = [u for u in filtered if not u.data_limit or u.data_limit == 0]
+            predicates.append(lambda u: not u.data_limit or u.data_limit == 0)
 
         if "sub_not_updated" in normalized_filters:
-            update_threshold = now - UPDATE_STALE_WINDOW
-            filtered = [u for u in filtered if not u.sub_updated_at or u.sub_updated_at < update_threshold]
+            predicates.append(lambda u: not u.sub_updated_at or u.sub_updated_at < update_threshold)
 
         if "sub_never_updated" in normalized_filters:
-            filtered = [u for u in filtered if not u.sub_updated_at]
+            predicates.append(lambda u: not u.sub_updated_at)
 
         status_candidates = [STATUS_FILTER_MAP[key] for key in normalized_filters if key in STATUS_FILTER_MAP]
         if status_candidates:
-            status_set = set(status_candidates)
-            filtered = [u for u in filtered if u.status in status_set]
+            advanced_status_set = set(status_candidates)
+            predicates.append(lambda u: u.status in advanced_status_set)
 
-    # Search filter
+    # Search is the most expensive predicate, so it runs last
     if search:
-        search_lower = search.lower()
-        key_candidates, uuid_candidates = _derive_search_tokens(search)
-        key_candidates_set = set(key_candidates) if key_candidates else set()
-        uuid_candidates_set = set(uuid_candidates) if uuid_candidates else set()
+        predicates.append(_search_predicate(search))
+
+    # Always exclude deleted users to keep cache results consistent with DB queries. The common
+    # zero/one-filter cases skip the generic all() dispatch, which dominates the loop otherwise.
+    deleted = UserStatus.deleted
+    if not predicates:
+        filtered = [u for u in users if u.status is not deleted]
+    elif len(predicates) == 1:
+        predicate = predicates[0]
+        filtered = [u for u in users if u.status is not deleted and predicate(u)]
+    else:
+        filtered = [u for u in users if u.status is not deleted and all(predicate(u) for predicate in predicates)]
 
-        def matches_search(u: User) -> bool:
-            if u.username and search_lower in u.username.lower():
-                return True
-            if u.note and search_lower in u.note.lower():
-                return True
-            if u.credential_key:
-                if search_lower in u.credential_key.lower():
-                    return True
-                if key_candidates_set:
-                    normalized_key = u.credential_key.replace("-", "").lower()
-                    if normalized_key in key_candidates_set:
-                        return True
-            if uuid_candidates_set and hasattr(u, "proxies") and u.proxies:
-                for proxy in u.proxies:
-                    # Handle both dict and string settings
-                    if isinstance(proxy.settings, dict):
-                        proxy_id = proxy.settings.get("id")
-                    elif isinstance(proxy.settings, str):
-                        try:
-                            proxy_settings = json.loads(proxy.settings)
-                            proxy_id = proxy_settings.get("id") if isinstance(proxy_settings, dict) else None
-                        except Exception:
-                            proxy_id = None
-                    else:
-                        proxy_id = None
+    return filtered
 
-                    if proxy_id and proxy_id in uuid_candidates_set:
-                        return True
-            return False
 
-        filtered = [u for u in filtered if matches_search(u)]
+def _should_use_db_fastpath(usernames: Optional[List[str]], search: Optional[str]) -> bool:
+    """
+    Whether a get_users call is selective enough to skip the Redis list scan.
+
+    Explicit usernames and UUID searches resolve through indexed lookups in the database,
+    which is cheaper than deserializing and filtering every cached user.
+    """
+    if usernames:
+        return True
+    if search:
+        _, uuid_candidates = _parse_search_uuid(search)
+        return bool(uuid_candidates)
+    return False
 
-    return filtered
+
+def _cache_fetched_users(users: List[User]) -> None:
+    """Cache users loaded from the database in Redis for future queries."""
+    if not users:
+        return
+    try:
+        from app.redis.cache import cache_users_bulk
+
+        cache_users_bulk(users)
+    except Exception as e:
+        _logger.debug(f"Failed to cache users in Redis: {e}")
+
+
+def _user_list_options(with_next_plan: bool) -> list:
+    """Loader options for user listings returned by get_users."""
+    options = [
+        selectinload(User.admin),
+        joinedload(User.service),
+        selectinload(User.proxies),
+    ]
+    if with_next_plan:
+        options.append(joinedload(User.next_plan))
+    return options
+
+
+# Prebuilt statements for the admin dashboard listing, keyed by whether next_plans is loaded.
+_ADMIN_PAGE_STATEMENTS: Dict[bool, Select] = {}
+_ADMIN_PAGE_COUNT = (
+    select(func.count())
+    .select_from(User.__table__)
+    .where(User.status != UserStatus.deleted, User.admin_id == bindparam("admin_id"))
+)
+
+
+def _get_users_admin_page(
+    db: Session, admin_id: int, offset: Optional[int], limit: int, return_with_count: bool
+) -> Union[List[User], Tuple[List[User], int]]:
+    """
+    DB path of get_users for its most common shape: one admin's users, newest first, one page.
+
+    The statement is built once per process and only re-bound per call, skipping the generic
+    filter cascade and query construction.
+    """
+    with_next_plan = _next_plan_table_exists(db)
+    stmt = _ADMIN_PAGE_STATEMENTS.get(with_next_plan)
+    if stmt is None:
+        stmt = (
+            select(User)
+            .where(User.status != UserStatus.deleted, User.admin_id == bindparam("admin_id"))
+            .order_by(_sort_clause(UsersSortingOptions["-created_at"]))
+            .offset(bindparam("offset"))
+            .limit(bindparam("limit"))
+            .options(*_user_list_options(with_next_plan))
+        )
+        _ADMIN_PAGE_STATEMENTS[with_next_plan] = stmt
+
+    users = list(db.execute(stmt, {"admin_id": admin_id, "offset": offset or 0, "limit": limit}).scalars())
+    _cache_fetched_users(users)
+
+    if return_with_count:
+        count = db.execute(_ADMIN_PAGE_COUNT, {"admin_id": admin_id}).scalar() or 0
+        return users, count
+    return users
 
 
 def get_users(
@@ -466,28 +630,21 @@ def get_users(
     # Ensure deterministic ordering (especially for Redis-sourced lists) so pagination is stable
     effective_sort = sort if sort else [UsersSortingOptions["-created_at"]]
 
-    # Try to get from Redis cache first
+    # Try to get from Redis cache first, unless an indexed DB lookup beats scanning the whole cached list
     try:
         from app.redis.cache import get_all_users_from_cache
         from app.redis.client import get_redis
         from config import REDIS_ENABLED, REDIS_USERS_CACHE_ENABLED
 
-        if REDIS_ENABLED and REDIS_USERS_CACHE_ENABLED and get_redis():
-            # Get all users from Redis (this is fast, just deserializes basic data)
+        if (
+            REDIS_ENABLED
+            and REDIS_USERS_CACHE_ENABLED
+            and not _should_use_db_fastpath(usernames, search)
+            and get_redis()
+        ):
+            # Get all users from Redis (this is fast, just deserializes basic data).
+            # A missing aggregated list is rebuilt by get_all_users_from_cache itself.
             all_users = get_all_users_from_cache(db)
-            # If aggregated list missing, ensure it's warmed for next calls
-            try:
-                from app.redis.cache import REDIS_KEY_USER_LIST_ALL, get_redis, USER_CACHE_TTL, _serialize_user
-
-                redis_client = get_redis()
-                if redis_client and all_users:
-                    redis_client.setex(
-                        REDIS_KEY_USER_LIST_ALL,
-                        USER_CACHE_TTL,
-                        json.dumps([_serialize_user(u) for u in all_users]),
-                    )
-            except Exception:
-                pass
 
             if all_users:
                 # Filter in memory (fast operation)
@@ -505,27 +662,7 @@ def get_users(
 
                 # Sort (fast operation on filtered list)
                 if effective_sort:
-                    for sort_opt in reversed(effective_sort):  # Apply sorts in reverse order
-                        sort_str = str(sort_opt.value).lower()
-                        reverse = "desc" in sort_str
-
-                        if "username" in sort_str:
-                            filtered_users.sort(key=lambda u: (u.username or "").lower(), reverse=reverse)
-                        elif "created_at" in sort_str:
-                            filtered_users.sort(
-                                key=lambda u: u.created_at or datetime.min.replace(tzinfo=timezone.utc), reverse=reverse
-                            )
-                        elif "used_traffic" in sort_str:
-                            filtered_users.sort(key=lambda u: getattr(u, "used_traffic", 0) or 0, reverse=reverse)
-                        elif "data_limit" in sort_str:
-                            filtered_users.sort(key=lambda u: u.data_limit or 0, reverse=reverse)
-                        elif "expire" in sort_str:
-                            filtered_users.sort(
-                                key=lambda u: u.expire or datetime.max.replace(tzinfo=timezone.utc)
-                                if u.expire
-                                else datetime.min.replace(tzinfo=timezone.utc),
-                                reverse=reverse,
-                            )
+                    _sort_cached_users(filtered_users, effective_sort)
 
                 # Get count before pagination (for return_with_count)
                 count = len(filtered_users) if return_with_count else None
@@ -548,6 +685,16 @@ def get_users(
 
     # Fallback to direct DB query
     try:
+        if (
+            admin is not None
+            and getattr(admin, "id", None) is not None
+            and limit
+            and not (usernames or search or status or admins or advanced_filters or reset_strategy)
+            and service_id is None
+            and effective_sort == [UsersSortingOptions["-created_at"]]
+        ):
+            return _get_users_admin_page(db, int(admin.id), offset, limit, return_with_count)
+
         query = get_user_queryset(db, eager_load=False)
         query = _apply_advanced_user_filters(
             query,
@@ -566,14 +713,13 @@ def get_users(
             if key_candidates:
                 search_clauses.append(User.credential_key.in_(key_candidates))
             if uuid_candidates:
-                proxy_exists = exists().where(
-                    and_(Proxy.user_id == User.id, Proxy.settings["id"].as_string().in_(uuid_candidates))
-                )
+                proxy_exists = exists().where(and_(Proxy.user_id == User.id, Proxy.settings_id.in_(uuid_candidates)))
                 search_clauses.append(proxy_exists)
             query = query.filter(or_(*search_clauses))
 
         if usernames:
-            query = query.filter(User.username.in_(usernames))
+            # Case-insensitive like the cached path, and served by ix_users_username_lower
+            query = query.filter(func.lower(User.username).in_([u.lower() for u in usernames]))
 
         if status:
             if isinstance(status, list):
@@ -598,35 +744,32 @@ def get_users(
 
         count = None
         if return_with_count:
-            # Use func.count() directly for better performance
-            count = query.with_entities(func.count(User.id)).scalar() or 0
+            # Count with a Core statement over the same WHERE clause, skipping ORM query compilation
+            count = db.execute(select(func.count()).select_from(User.__table__).where(query.whereclause)).scalar() or 0
 
-        query = query.options(
-            joinedload(User.admin),
-            joinedload(User.service),
-            selectinload(User.proxies),
-        )
-        if _next_plan_table_exists(db):
-            query = query.options(joinedload(User.next_plan))
+        list_options = _user_list_options(_next_plan_table_exists(db))
 
         if effective_sort:
-            query = query.order_by(*(opt.value for opt in effective_sort))
+            query = query.order_by(*(_sort_clause(opt) for opt in effective_sort))
 
         if offset:
             query = query.offset(offset)
-        if limit:
-            query = query.limit(limit)
-
-        users = query.all()
 
-        # Cache users in Redis for future queries
-        try:
-            from app.redis.cache import cache_user
-
-            for user in users:
-                cache_user(user)
-        except Exception as e:
-            _logger.debug(f"Failed to cache users in Redis: {e}")
+        if limit:
+            users = query.options(*list_options).limit(limit).all()
+            _cache_fetched_users(users)
+        else:
+            # An unpaginated listing can cover every user: resolve the ordered ids first, then hydrate
+            # (and cache) them in bounded windows. A streamed yield_per cursor is not an option, since
+            # the eager and lazy loads it triggers would run mid-stream on the same MySQL connection.
+            user_ids = [user_id for (user_id,) in query.with_entities(User.id)]
+            users = []
+            for start in range(0, len(user_ids), _USERS_LIST_WINDOW_SIZE):
+                window = user_ids[start : start + _USERS_LIST_WINDOW_SIZE]
+                loaded = {user.id: user for user in db.query(User).options(*list_options).filter(User.id.in_(window))}
+                batch = [loaded[user_id] for user_id in window if user_id in loaded]
+                _cache_fetched_users(batch)
+                users.extend(batch)
 
         if return_with_count:
             return users, count
@@ -656,14 +799,6 @@ def get_users_count(db: Session, status: UserStatus = None, admin: Admin = None)
     return query.scalar() or 0
 
 
-def _status_to_str(status: Union[UserStatus, str, None]) -> Optional[str]:
-    if status is None:
-        return None
-    if isinstance(status, Enum):
-        return status.value
-    return str(status)
-
-
 def _is_user_limit_enforced(admin: Optional[Admin]) -> bool:
     return bool(admin and admin.users_limit is not None and admin.users_limit > 0)
 
@@ -711,21 +846,21 @@ def _ensure_active_user_capacity(
 def create_user(db: Session, user: UserCreate, admin: Admin = None, service: Optional[Service] = None) -> User:
     """Creates a new user with provided details."""
     normalized_username = user.username.lower()
-    existing_user = (
-        db.query(User)
+    existing_user_id = (
+        db.query(User.id)
         .filter(func.lower(User.username) == normalized_username)
         .filter(User.status != UserStatus.deleted)
-        .first()
+        .limit(1)
+        .scalar()
     )
-    if existing_user:
+    if existing_user_id is not None:
         raise IntegrityError(
             None,
             {"username": user.username},
             Exception("User username already exists"),
         )
 
-    status_value = _status_to_str(user.status) or UserStatus.active.value
-    resolved_status = UserStatus(status_value)
+    resolved_status = UserStatus(user.status or UserStatus.active)
     if admin:
         _ensure_active_user_capacity(db, admin, required_slots=1)
 
@@ -738,7 +873,7 @@ def create_user(db: Session, user: UserCreate, admin: Admin = None, service: Opt
     if not credential_key:
         has_static_credentials = False
         for proxy_key, settings in user.proxies.items():
-            proxy_type = ProxyTypes(proxy_key)
+            proxy_type = _as_proxy_type(proxy_key)
             if proxy_type in UUID_PROTOCOLS and getattr(settings, "id", None):
                 has_static_credentials = True
                 break
@@ -752,10 +887,13 @@ def create_user(db: Session, user: UserCreate, admin: Admin = None, service: Opt
             # We should also strip any (empty/invalid) credentials just in case, though they shouldn't exist if has_static_credentials is False
             # But more importantly, we need to make sure serialize_proxy_settings knows we have a key now.
 
+    inbounds_by_tag = get_or_create_inbounds(
+        db, (tag for proxy_key in user.proxies for tag in excluded_inbounds_tags[_as_proxy_type(proxy_key)])
+    )
     proxies = []
     for proxy_key, settings in user.proxies.items():
-        proxy_type = ProxyTypes(proxy_key)
-        excluded_inbounds = [get_or_create_inbound(db, tag) for tag in excluded_inbounds_tags[proxy_type]]
+        proxy_type = _as_proxy_type(proxy_key)
+        excluded_inbounds = [inbounds_by_tag[tag] for tag in excluded_inbounds_tags[proxy_type]]
         # If we just generated a key, we pass it here.
         # If we have static credentials and no key, credential_key is None.
         serialized = serialize_proxy_settings(
@@ -845,7 +983,7 @@ def remove_user(db: Session, dbuser: User) -> User:
     except DataError as exc:
         db.rollback()
         if not _ensure_user_deleted_status(db):
-            db.delete(dbuser)
+            hard_delete_user(db, dbuser)
             db.commit()
             physically_deleted = True
         else:
@@ -864,6 +1002,7 @@ def remove_user(db: Session, dbuser: User) -> User:
 def remove_users(db: Session, dbusers: List[User]):
     """Removes multiple users from the database."""
     updated = False
+    user_ids = [dbuser.id for dbuser in dbusers]
     for dbuser in dbusers:
         if dbuser.status != UserStatus.deleted:
             dbuser.status = UserStatus.deleted
@@ -875,12 +1014,13 @@ def remove_users(db: Session, dbusers: List[User]):
             db.rollback()
             if not _ensure_user_deleted_status(db):
                 for dbuser in dbusers:
-                    db.delete(dbuser)
+                    db.expunge(dbuser)
+                _purge_users(db, user_ids)
                 db.commit()
             else:
-                for dbuser in dbusers:
-                    dbuser.status = UserStatus.deleted
-                    db.add(dbuser)
+                db.query(User).filter(User.id.in_(user_ids)).update(
+                    {User.status: UserStatus.deleted}, synchronize_session=False
+                )
                 try:
                     db.commit()
                 except DataError:
@@ -896,11 +1036,40 @@ def _delete_user_usage_rows(db: Session, user_ids: List[int]) -> None:
     db.query(UserUsageResetLogs).filter(UserUsageResetLogs.user_id.in_(user_ids)).delete(synchronize_session=False)
 
 
+def _usage_rows_cascade(db: Session) -> bool:
+    # Usage rows reference users with ON DELETE CASCADE, but SQLite only honours it with
+    # foreign key enforcement, which the app does not turn on.
+    return db.get_bind().dialect.name != "sqlite"
+
+
+def _purge_users(db: Session, user_ids: List[int]) -> None:
+    """Physically deletes users and the rows that depend on them, one DELETE per table."""
+    if not user_ids:
+        return
+    has_next_plan_table = _next_plan_table_exists(db)
+    user_proxy_ids = select(Proxy.id).where(Proxy.user_id.in_(user_ids))
+    db.execute(
+        delete(excluded_inbounds_association).where(excluded_inbounds_association.c.proxy_id.in_(user_proxy_ids))
+    )
+    db.query(Proxy).filter(Proxy.user_id.in_(user_ids)).delete(synchronize_session=False)
+    if has_next_plan_table:
+        db.query(NextPlan).filter(NextPlan.user_id.in_(user_ids)).delete(synchronize_session=False)
+    if not _usage_rows_cascade(db):
+        _delete_user_usage_rows(db, user_ids)
+    db.query(User).filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+
+
+def hard_delete_users(db: Session, dbusers: List[User]) -> None:
+    """Permanently remove users and their dependent usage records without soft-deleting."""
+    if not _usage_rows_cascade(db):
+        _delete_user_usage_rows(db, [dbuser.id for dbuser in dbusers if dbuser.id is not None])
+    for dbuser in dbusers:
+        db.delete(dbuser)
+
+
 def hard_delete_user(db: Session, dbuser: User) -> None:
     """Permanently remove a user and dependent usage records without soft-deleting."""
-    if dbuser.id is not None:
-        _delete_user_usage_rows(db, [dbuser.id])
-    db.delete(dbuser)
+    hard_delete_users(db, [dbuser])
 
 
 def update_user(
@@ -913,18 +1082,21 @@ def update_user(
     admin: Optional[Admin] = None,
 ) -> User:
     """Updates a user with new details."""
-    original_status_value = _status_to_str(dbuser.status)
+    original_status = dbuser.status
     credential_key = dbuser.credential_key
     added_proxies: Dict[ProxyTypes, Proxy] = {}
+    # dbuser.proxies is already loaded by get_user; index it instead of querying once per proxy type
+    existing_proxies: Dict[ProxyTypes, Proxy] = {}
+    if modify.proxies or modify.inbounds:
+        for proxy in dbuser.proxies:
+            existing_proxies.setdefault(_as_proxy_type(proxy.type), proxy)
 
     if modify.proxies:
-        pass
-
-        modify_proxy_types = {ProxyTypes(key) for key in modify.proxies}
+        modify_proxy_types = {_as_proxy_type(key) for key in modify.proxies}
 
         for proxy_key, settings in modify.proxies.items():
-            proxy_type = ProxyTypes(proxy_key)
-            dbproxy = db.query(Proxy).where(Proxy.user == dbuser, Proxy.type == proxy_type).first()
+            proxy_type = _as_proxy_type(proxy_key)
+            dbproxy = existing_proxies.get(proxy_type)
             if dbproxy:
                 existing_uuid = dbproxy.settings.get("id") if isinstance(dbproxy.settings, dict) else None
                 existing_password = dbproxy.settings.get("password") if isinstance(dbproxy.settings, dict) else None
@@ -961,18 +1133,20 @@ def update_user(
             if proxy.type not in modify.proxies and proxy.type not in existing_types:
                 db.delete(proxy)
     if modify.inbounds:
+        targets = []
         for proxy_type, tags in modify.excluded_inbounds.items():
-            dbproxy = db.query(Proxy).where(
-                Proxy.user == dbuser, Proxy.type == proxy_type
-            ).first() or added_proxies.get(proxy_type)
+            dbproxy = existing_proxies.get(_as_proxy_type(proxy_type)) or added_proxies.get(proxy_type)
             if dbproxy:
-                dbproxy.excluded_inbounds = [get_or_create_inbound(db, tag) for tag in tags]
+                targets.append((dbproxy, tags))
+        inbounds_by_tag = get_or_create_inbounds(db, (tag for _, tags in targets for tag in tags))
+        for dbproxy, tags in targets:
+            dbproxy.excluded_inbounds = [inbounds_by_tag[tag] for tag in tags]
 
     if "flow" in modify.model_fields_set:
         dbuser.flow = modify.flow
 
     if modify.status is not None:
-        dbuser.status = modify.status
+        dbuser.status = UserStatus(modify.status)
     if "data_limit" in modify.model_fields_set:
         dbuser.data_limit = modify.data_limit or None
         if dbuser.status not in (UserStatus.expired, UserStatus.disabled):
@@ -1027,25 +1201,20 @@ def update_user(
 
                 _ensure_admin_service_link(db, admin, service)
 
-    current_status_value = _status_to_str(dbuser.status)
-    if current_status_value == UserStatus.active.value and original_status_value != UserStatus.active.value:
+    if dbuser.status == UserStatus.active and original_status != UserStatus.active:
         _ensure_active_user_capacity(db, dbuser.admin, exclude_user_ids=(dbuser.id,))
     dbuser.edit_at = datetime.now(timezone.utc)
 
+    user_id = dbuser.id
     db.commit()
-    db.refresh(dbuser)
-    # Ensure proxy relationships/excluded inbounds are loaded before returning (background tasks/Xray sync)
-    try:
-        for proxy in dbuser.proxies:
-            _ = list(proxy.excluded_inbounds)
-    except Exception as e:  # pragma: no cover - defensive logging
-        _logger.debug("Failed to pre-load proxy relationships for updated user %s: %s", dbuser.username, e)
+    # Refresh with every relationship eager-loaded (proxies with their excluded inbounds included) so the
+    # user stays usable once detached (background tasks/Xray sync), without a lazy load per proxy
+    get_user_queryset(db).filter(User.id == user_id).populate_existing().first()
 
     # Update user in Redis cache and mark for sync
     try:
-        from app.redis.cache import cache_user, invalidate_user_cache
+        from app.redis.cache import cache_user
 
-        invalidate_user_cache(username=dbuser.username, user_id=dbuser.id)
         cache_user(dbuser, mark_for_sync=True)
     except Exception as e:
         _logger.warning(f"Failed to update user in Redis cache: {e}")
@@ -1053,69 +1222,93 @@ def update_user(
     return dbuser
 
 
-def reset_user_by_next(db: Session, dbuser: User) -> User:
-    """Resets the data usage of a user based on next user."""
+def reset_users_by_next(db: Session, dbusers: Iterable[User]) -> List[User]:
+    """Resets the data usage of users based on their next plans; users without one are skipped.
 
-    if dbuser.next_plan is None:
-        return
-    db.add(UserUsageResetLogs(user=dbuser, used_traffic_at_reset=dbuser.used_traffic))
-    dbuser.node_usages.clear()
-    if _status_to_str(dbuser.status) != UserStatus.active.value:
-        _ensure_active_user_capacity(db, dbuser.admin, exclude_user_ids=(dbuser.id,))
-    dbuser.status = UserStatus.active.value
-    dbuser.data_limit = dbuser.next_plan.data_limit + (
-        0 if dbuser.next_plan.add_remaining_traffic else dbuser.data_limit - dbuser.used_traffic
+    Runs one statement per table for the whole batch and returns the reset users, reloaded.
+    """
+    dbusers = [dbuser for dbuser in dbusers if dbuser.next_plan is not None]
+    if not dbusers:
+        return []
+
+    owners = {dbuser.admin_id: dbuser.admin for dbuser in dbusers if dbuser.status != UserStatus.active}
+    for owner in owners.values():
+        _ensure_active_user_capacity(db, owner)
+
+    user_ids = [dbuser.id for dbuser in dbusers]
+    db.execute(
+        UserUsageResetLogs.__table__.insert(),
+        [{"user_id": dbuser.id, "used_traffic_at_reset": dbuser.used_traffic} for dbuser in dbusers],
+    )
+    db.query(NodeUserUsage).filter(NodeUserUsage.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.bulk_update_mappings(
+        User,
+        [
+            {
+                "id": dbuser.id,
+                "status": UserStatus.active,
+                "data_limit": dbuser.next_plan.data_limit
+                + (0 if dbuser.next_plan.add_remaining_traffic else dbuser.data_limit - dbuser.used_traffic),
+                "expire": dbuser.next_plan.expire,
+                "used_traffic": 0,
+            }
+            for dbuser in dbusers
+        ],
+    )
+    db.query(NextPlan).filter(NextPlan.id.in_([dbuser.next_plan.id for dbuser in dbusers])).delete(
+        synchronize_session=False
     )
-    dbuser.expire = dbuser.next_plan.expire
-    dbuser.used_traffic = 0
-    db.delete(dbuser.next_plan)
-    dbuser.next_plan = None
-    db.add(dbuser)
     db.commit()
-    db.refresh(dbuser)
+    dbusers = get_user_queryset(db).filter(User.id.in_(user_ids)).populate_existing().all()
 
-    # Update user in Redis cache and mark for sync
+    # Update users in Redis cache and mark for sync
     try:
         from app.redis.cache import cache_user
 
-        cache_user(dbuser, mark_for_sync=True)
+        for dbuser in dbusers:
+            cache_user(dbuser, mark_for_sync=True)
     except Exception as e:
         _logger.warning(f"Failed to update user in Redis cache: {e}")
 
+    return dbusers
+
+
+def reset_user_by_next(db: Session, dbuser: User) -> User:
+    """Resets the data usage of a user based on next user."""
+
+    if dbuser.next_plan is None:
+        return
+    reset_users_by_next(db, [dbuser])
     return dbuser
 
 
+def _proxy_has_legacy_credentials(proxy: Proxy) -> bool:
+    """Whether the proxy still stores a UUID/password instead of deriving it from the credential key."""
+    proxy_type = _as_proxy_type(proxy.type)
+    settings = proxy.settings if isinstance(proxy.settings, dict) else {}
+    if proxy_type in UUID_PROTOCOLS:
+        return bool(settings.get("id"))
+    if proxy_type in PASSWORD_PROTOCOLS:
+        return bool(settings.get("password"))
+    return False
+
+
 def revoke_user_sub(db: Session, dbuser: User) -> User:
     """Revokes the subscription of a user and updates proxies settings."""
     dbuser.sub_revoked_at = datetime.now(timezone.utc)
 
-    # Check if user has UUID/password stored in proxies table (legacy method)
-    has_legacy_credentials = False
-    for proxy in dbuser.proxies:
-        proxy_type = proxy.type
-        if isinstance(proxy_type, str):
-            proxy_type = ProxyTypes(proxy_type)
-        settings = proxy.settings if isinstance(proxy.settings, dict) else {}
-
-        # Check if UUID or password exists in settings
-        if proxy_type in UUID_PROTOCOLS and settings.get("id"):
-            has_legacy_credentials = True
-            break
-        elif proxy_type in PASSWORD_PROTOCOLS and settings.get("password"):
-            has_legacy_credentials = True
-            break
-
     # Generate new key (either first time or update existing)
+    previous_key = dbuser.credential_key
     new_key = generate_key()
     dbuser.credential_key = new_key
 
-    if has_legacy_credentials:
+    proxies = list(dbuser.proxies)
+    if any(_proxy_has_legacy_credentials(proxy) for proxy in proxies):
         # User has legacy credentials - remove UUID/password from proxies table
         # and migrate to key-based method
-        for proxy in dbuser.proxies:
-            proxy_type = proxy.type
-            if isinstance(proxy_type, str):
-                proxy_type = ProxyTypes(proxy_type)
+        updates = []
+        for proxy in proxies:
+            proxy_type = _as_proxy_type(proxy.type)
             settings_obj = ProxySettings.from_dict(proxy_type, proxy.settings)
 
             # Remove UUID/password from settings (will be generated from key at runtime)
@@ -1125,8 +1318,16 @@ def revoke_user_sub(db: Session, dbuser: User) -> User:
                 settings_obj.password = None
 
             # Serialize without preserving existing UUID/password
-            proxy.settings = serialize_proxy_settings(settings_obj, proxy_type, new_key, preserve_existing_uuid=False)
-    else:
+            updates.append(
+                {
+                    "id": proxy.id,
+                    "settings": serialize_proxy_settings(
+                        settings_obj, proxy_type, new_key, preserve_existing_uuid=False
+                    ),
+                }
+            )
+        db.bulk_update_mappings(Proxy, updates)
+    elif proxies:
         # User already has key or no legacy credentials - just update key
         _apply_key_to_existing_proxies(dbuser, new_key)
 
@@ -1136,7 +1337,11 @@ def revoke_user_sub(db: Session, dbuser: User) -> User:
     # Update user in Redis cache and mark for sync
     try:
         from app.redis.cache import cache_user
+        from app.redis.subscription import invalidate_user_cache as invalidate_subscription_cache
 
+        # Redis is shared by every worker; dropping the old key mapping is all the invalidation needed
+        if previous_key:
+            invalidate_subscription_cache(dbuser.username, previous_key)
         cache_user(dbuser, mark_for_sync=True)
     except Exception as e:
         _logger.warning(f"Failed to update user in Redis cache: {e}")
@@ -1156,46 +1361,64 @@ def update_user_sub(db: Session, dbuser: User, user_agent: str) -> User:
 
     while attempts < max_attempts:
         attempts += 1
-        # Always fetch fresh user from DB to ensure it's in session
-        dbuser = db.query(User).filter(User.id == user_id).with_for_update().first()
-        if not dbuser:
-            raise ValueError(f"User with id {user_id} not found")
-
-        dbuser.sub_updated_at = datetime.now(timezone.utc)
-        dbuser.sub_last_user_agent = user_agent
         try:
+            # A single UPDATE by primary key locks the row itself; no SELECT ... FOR UPDATE needed
+            result = db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(sub_updated_at=datetime.now(timezone.utc), sub_last_user_agent=user_agent)
+                .execution_options(synchronize_session=False)
+            )
+            if not result.rowcount:
+                db.rollback()
+                raise ValueError(f"User with id {user_id} not found")
             db.commit()
-            db.refresh(dbuser)
-            return dbuser
         except OperationalError as exc:
             db.rollback()
             if not _is_record_changed_error(exc) or attempts >= max_attempts:
                 raise
-            # Re-fetch the user to ensure we start from the latest row state
-            dbuser = db.query(User).filter(User.id == user_id).with_for_update().first()
-            if not dbuser:
-                raise
             continue
+        if isinstance(dbuser, User) and dbuser in db:
+            return dbuser
+        return db.get(User, user_id)
 
 
-def _sync_user_status_from_expire(db: Session, dbuser: User, now: float) -> None:
-    status_value = _status_to_str(dbuser.status)
-    if status_value not in (UserStatus.active.value, UserStatus.expired.value):
-        return
-    if not dbuser.expire or dbuser.expire > now:
-        target_status = UserStatus.active
-    else:
-        target_status = UserStatus.expired
-    if target_status.value == status_value:
-        return
-    dbuser.status = target_status
-    dbuser.last_status_change = datetime.now(timezone.utc)
-    if target_status == UserStatus.active:
-        _ensure_active_user_capacity(
-            db,
-            dbuser.admin,
-            exclude_user_ids=(dbuser.id,),
-        )
+def _ensure_bulk_activation_capacity(db: Session, activated: Query, *, reserve_each: bool = False) -> None:
+    """Runs the users limit check once per admin owning a user ``activated`` is about to turn active.
+
+    Like the per-user check it replaces, it sees the database as it was before any of them is activated.
+    With ``reserve_each`` every admin must instead have a free slot for each of their users in ``activated``.
+    """
+    slots_by_owner = dict(
+        activated.with_entities(User.admin_id, func.count(User.id) if reserve_each else literal_column("1"))
+        .group_by(User.admin_id)
+        .all()
+    )
+    slots_by_owner.pop(None, None)
+    if slots_by_owner:
+        for owner in db.query(Admin).filter(Admin.id.in_(slots_by_owner)):
+            _ensure_active_user_capacity(db, owner, required_slots=slots_by_owner[owner.id])
+
+
+def _sync_bulk_status_from_usage(db: Session, query: Query) -> None:
+    """Limits users of ``query`` that are over their data limit and reactivates limited ones that no longer are.
+
+    Expired, disabled and deleted users are left alone, and on-hold users are only ever limited.
+    """
+    over_limit = and_(User.data_limit > 0, User.used_traffic >= User.data_limit)
+    within_limit = or_(User.data_limit.is_(None), User.data_limit <= 0, User.used_traffic < User.data_limit)
+    changed_at = datetime.now(timezone.utc)
+
+    query.filter(User.status.in_((UserStatus.active, UserStatus.on_hold)), over_limit).update(
+        {User.status: UserStatus.limited, User.last_status_change: changed_at},
+        synchronize_session=False,
+    )
+    released = query.filter(User.status == UserStatus.limited, within_limit)
+    _ensure_bulk_activation_capacity(db, released)
+    released.update(
+        {User.status: UserStatus.active, User.last_status_change: changed_at},
+        synchronize_session=False,
+    )
 
 
 def adjust_all_users_expire(
@@ -1207,45 +1430,21 @@ def adjust_all_users_expire(
 ) -> int:
     if delta_seconds == 0:
         return 0
-    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment).filter(
+    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment, eager_load=False).filter(
         User.status == UserStatus.active, User.expire.isnot(None)
     )
-    now = datetime.now(timezone.utc).timestamp()
-    count = 0
-    for dbuser in query.all():
-        dbuser.expire = (dbuser.expire or 0) + delta_seconds
-        _sync_user_status_from_expire(db, dbuser, now)
-        db.add(dbuser)
-        count += 1
+    count = query.update({User.expire: User.expire + delta_seconds}, synchronize_session=False)
     if count:
+        # Only active users are adjusted, so the sole transition is to expired
+        now = datetime.now(timezone.utc)
+        query.filter(User.expire != 0, User.expire <= now.timestamp()).update(
+            {User.status: UserStatus.expired, User.last_status_change: now},
+            synchronize_session=False,
+        )
         db.commit()
     return count
 
 
-def _sync_user_status_from_usage(db: Session, dbuser: User) -> None:
-    status_value = _status_to_str(dbuser.status)
-    if status_value in (UserStatus.expired.value, UserStatus.disabled.value):
-        return
-    limit = dbuser.data_limit or 0
-    target_status: Optional[UserStatus] = None
-    if limit > 0 and dbuser.used_traffic >= limit:
-        target_status = UserStatus.limited
-    elif status_value == UserStatus.on_hold.value:
-        return
-    else:
-        target_status = UserStatus.active
-
-    if target_status and target_status.value != status_value:
-        dbuser.status = target_status
-        dbuser.last_status_change = datetime.now(timezone.utc)
-        if target_status == UserStatus.active:
-            _ensure_active_user_capacity(
-                db,
-                dbuser.admin,
-                exclude_user_ids=(dbuser.id,),
-            )
-
-
 def adjust_all_users_usage(
     db: Session,
     delta_bytes: int,
@@ -1254,14 +1453,14 @@ def adjust_all_users_usage(
 ) -> int:
     if delta_bytes == 0:
         return 0
-    query = _build_user_bulk_query(db, admin, service_id, False)
-    count = 0
-    for dbuser in query.all():
-        dbuser.used_traffic = max(dbuser.used_traffic + delta_bytes, 0)
-        _sync_user_status_from_usage(db, dbuser)
-        db.add(dbuser)
-        count += 1
+    query = _build_user_bulk_query(db, admin, service_id, False, eager_load=False)
+    used_traffic = coalesce(User.used_traffic, 0) + delta_bytes
+    count = query.update(
+        {User.used_traffic: case((used_traffic > 0, used_traffic), else_=0)},
+        synchronize_session=False,
+    )
     if count:
+        _sync_bulk_status_from_usage(db, query)
         db.commit()
     return count
 
@@ -1326,19 +1525,23 @@ def adjust_all_users_limit(
     """Increase or decrease data limits for users, optionally scoped by admin/service."""
     if delta_bytes == 0:
         return 0
-    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment).filter(
+    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment, eager_load=False)
+    data_limit = User.data_limit + delta_bytes
+    count = query.filter(
         User.status == UserStatus.active,
         User.data_limit.isnot(None),
         User.data_limit > 0,
-    )
-    count = 0
-    for dbuser in query.all():
-        new_limit = max((dbuser.data_limit or 0) + delta_bytes, 0)
-        dbuser.data_limit = new_limit
-        _sync_user_status_from_usage(db, dbuser)
-        db.add(dbuser)
-        count += 1
+    ).update({User.data_limit: case((data_limit > 0, data_limit), else_=0)}, synchronize_session=False)
     if count:
+        # Only active users are adjusted, so the sole transition is to limited
+        query.filter(
+            User.status == UserStatus.active,
+            User.data_limit > 0,
+            User.used_traffic >= User.data_limit,
+        ).update(
+            {User.status: UserStatus.limited, User.last_status_change: datetime.now(timezone.utc)},
+            synchronize_session=False,
+        )
         db.commit()
     return count
 
@@ -1352,14 +1555,15 @@ def delete_users_by_status_age(
     service_without_assignment: bool = False,
 ) -> int:
     cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment).filter(
+    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment, eager_load=False).filter(
         User.status.in_(statuses), User.last_status_change.isnot(None), User.last_status_change <= cutoff
     )
-    candidates = query.all()
-    if not candidates:
-        return 0
-    remove_users(db, candidates)
-    return len(candidates)
+    # Only the status is changed, so load the candidates without relationships and one window at a time
+    candidate_ids = [user_id for (user_id,) in query.with_entities(User.id)]
+    for start in range(0, len(candidate_ids), _USERS_LIST_WINDOW_SIZE):
+        window_ids = candidate_ids[start : start + _USERS_LIST_WINDOW_SIZE]
+        remove_users(db, db.query(User).filter(User.id.in_(window_ids)).all())
+    return len(candidate_ids)
 
 
 def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
@@ -1383,36 +1587,22 @@ def activate_all_disabled_users(db: Session, admin: Optional[Admin] = None):
         admin (Optional[Admin]): Admin to filter users by, if any.
     """
     disabled_users_query = db.query(User).filter(User.status == UserStatus.disabled)
-    on_hold_candidates_query = db.query(User).filter(
-        and_(
-            User.status == UserStatus.disabled,
-            User.expire.is_(None),
-            User.on_hold_expire_duration.isnot(None),
-            User.online_at.is_(None),
-        )
-    )
     if admin:
         disabled_users_query = disabled_users_query.filter(User.admin == admin)
-        on_hold_candidates_query = on_hold_candidates_query.filter(User.admin == admin)
-
-    for user in on_hold_candidates_query.all():
-        user.status = UserStatus.on_hold
-        user.last_status_change = datetime.now(timezone.utc)
-
-    # Refresh query to account for users moved to on-hold status
-    disabled_users_query = db.query(User).filter(User.status == UserStatus.disabled)
-    if admin:
-        disabled_users_query = disabled_users_query.filter(User.admin == admin)
-
-    for user in disabled_users_query.all():
-        if _status_to_str(user.status) != UserStatus.active.value:
-            _ensure_active_user_capacity(
-                db,
-                user.admin,
-                exclude_user_ids=(user.id,),
-            )
-        user.status = UserStatus.active
-        user.last_status_change = datetime.now(timezone.utc)
+    changed_at = datetime.now(timezone.utc)
+
+    # Users that never connected and wait for their first connection go back on hold
+    disabled_users_query.filter(
+        User.expire.is_(None),
+        User.on_hold_expire_duration.isnot(None),
+        User.online_at.is_(None),
+    ).update({User.status: UserStatus.on_hold, User.last_status_change: changed_at}, synchronize_session=False)
+
+    # The rest are activated
+    _ensure_bulk_activation_capacity(db, disabled_users_query)
+    disabled_users_query.update(
+        {User.status: UserStatus.active, User.last_status_change: changed_at}, synchronize_session=False
+    )
 
     db.commit()
 
@@ -1424,33 +1614,40 @@ def bulk_update_user_status(
     service_id: Optional[int] = None,
     service_without_assignment: bool = False,
 ) -> int:
-    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment)
-    count = 0
-    for user in query.all():
-        if user.status == target_status:
-            continue
-        if target_status == UserStatus.active and _status_to_str(user.status) != UserStatus.active.value:
-            _ensure_active_user_capacity(db, user.admin, exclude_user_ids=(user.id,))
-        user.status = target_status
-        user.last_status_change = datetime.now(timezone.utc)
-        db.add(user)
-        count += 1
+    query = _build_user_bulk_query(db, admin, service_id, service_without_assignment, eager_load=False).filter(
+        User.status != target_status
+    )
+    if target_status == UserStatus.active:
+        # Every matched user becomes a new active user, so reserve a slot for each up front
+        _ensure_bulk_activation_capacity(db, query, reserve_each=True)
+    count = query.update(
+        {User.status: target_status, User.last_status_change: datetime.now(timezone.utc)},
+        synchronize_session=False,
+    )
     if count:
         db.commit()
     return count
 
 
+def _add_days_expr(column, days, dialect_name: str):
+    """Return a SQL expression for ``column`` plus ``days`` days, or None if the dialect is unknown."""
+    if dialect_name == "postgresql":
+        return column + func.make_interval(0, 0, 0, days)
+    if dialect_name == "sqlite":
+        return func.datetime(column, func.printf("%d days", days))
+    if dialect_name in {"mysql", "mariadb"}:
+        return func.timestampadd(literal_column("DAY"), days, column)
+    return None
+
+
 def autodelete_expired_users(db: Session, include_limited_users: bool = False) -> List[User]:
     """Deletes expired (optionally also limited) users whose auto-delete time has passed."""
     target_status = [UserStatus.expired] if not include_limited_users else [UserStatus.expired, UserStatus.limited]
 
-    auto_delete = coalesce(User.auto_delete_in_days, USERS_AUTODELETE_DAYS)
+    auto_delete = coalesce(User.auto_delete_in_days, USERS_AUTODELETE_DAYS)  # Global days as fallback
 
     query = (
-        db.query(
-            User,
-            auto_delete,  # Use global auto-delete days as fallback
-        )
+        db.query(User)
         .filter(
             auto_delete >= 0,  # Negative values prevent auto-deletion
             User.status.in_(target_status),
@@ -1458,11 +1655,18 @@ def autodelete_expired_users(db: Session, include_limited_users: bool = False) -
         .options(joinedload(User.admin))
     )
 
-    expired_users = [
-        user
-        for (user, auto_delete) in query
-        if user.last_status_change + timedelta(days=auto_delete) <= datetime.now(timezone.utc)
-    ]
+    # last_status_change holds naive UTC; an aware bind would be shifted by the server's time zone on PostgreSQL
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    delete_at = _add_days_expr(User.last_status_change, auto_delete, db.get_bind().dialect.name)
+    if delete_at is not None:
+        # Only fetch the users that are due
+        expired_users = query.filter(delete_at <= now).all()
+    else:
+        expired_users = [
+            user
+            for (user, days) in query.add_columns(auto_delete)
+            if user.last_status_change + timedelta(days=days) <= now
+        ]
 
     if expired_users:
         remove_users(db, expired_users)
@@ -1498,6 +1702,27 @@ def start_user_expire(db: Session, dbuser: User) -> User:
     return dbuser
 
 
+def _set_template_inbound_tags(
+    db: Session, template_id: int, inbound_tags: Iterable[str], current_tags: Set[str]
+) -> None:
+    """Links a template to the known inbounds among ``inbound_tags``, writing only the links that change.
+
+    The association rows hold tags, so they are written directly instead of through the ``inbounds`` collection.
+    """
+    wanted = set(db.scalars(select(ProxyInbound.tag).where(ProxyInbound.tag.in_(set(inbound_tags)))))
+    if wanted == current_tags:
+        return
+    links = template_inbounds_association
+    if current_tags - wanted:
+        db.execute(
+            delete(links).where(links.c.user_template_id == template_id, links.c.inbound_tag.in_(current_tags - wanted))
+        )
+    if wanted - current_tags:
+        db.execute(
+            links.insert(), [{"user_template_id": template_id, "inbound_tag": tag} for tag in wanted - current_tags]
+        )
+
+
 def create_user_template(db: Session, user_template: UserTemplateCreate) -> UserTemplate:
     """Creates a new user template in the database."""
     inbound_tags: List[str] = []
@@ -1509,9 +1734,10 @@ def create_user_template(db: Session, user_template: UserTemplateCreate) -> User
         expire_duration=user_template.expire_duration,
         username_prefix=user_template.username_prefix,
         username_suffix=user_template.username_suffix,
-        inbounds=db.query(ProxyInbound).filter(ProxyInbound.tag.in_(inbound_tags)).all(),
     )
     db.add(dbuser_template)
+    db.flush()
+    _set_template_inbound_tags(db, dbuser_template.id, inbound_tags, set())
     db.commit()
     db.refresh(dbuser_template)
     return dbuser_template
@@ -1536,7 +1762,8 @@ def update_user_template(
         inbound_tags: List[str] = []
         for _, i in modified_user_template.inbounds.items():
             inbound_tags.extend(i)
-        dbuser_template.inbounds = db.query(ProxyInbound).filter(ProxyInbound.tag.in_(inbound_tags)).all()
+        current_tags = {inbound.tag for inbound in dbuser_template.inbounds}
+        _set_template_inbound_tags(db, dbuser_template.id, inbound_tags, current_tags)
 
     db.commit()
     db.refresh(dbuser_template)
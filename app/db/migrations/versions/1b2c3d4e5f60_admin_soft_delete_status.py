@@ -20,6 +20,21 @@ depends_on = None
 ADMIN_STATUS_ENUM = sa.Enum("active", "deleted", name="adminstatus")
 
 
+def _create_index_if_absent(bind, name, table, columns, unique=False) -> None:
+    # PostgreSQL, SQLite and MariaDB skip an existing index at the DDL level. MySQL has no
+    # CREATE INDEX IF NOT EXISTS, so a duplicate (error 1061) is tolerated there instead.
+    dialect = bind.dialect
+    if dialect.name != "mysql" or getattr(dialect, "is_mariadb", False):
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+        return
+    try:
+        op.create_index(name, table, columns, unique=unique)
+    except sa.exc.DBAPIError as e:
+        error_msg = str(e).lower()
+        if "duplicate" not in error_msg and "1061" not in error_msg:
+            raise
+
+
 def upgrade() -> None:
     bind = op.get_bind()
     dialect = bind.dialect.name
@@ -33,6 +48,7 @@ def upgrade() -> None:
 
     if dialect == "sqlite":
         op.execute("DROP TABLE IF EXISTS _alembic_tmp_admins")
+        # Drop the indexes first so the single recreate below does not copy the unique username index
         op.execute("DROP INDEX IF EXISTS ix_admins_username")
         op.execute("DROP INDEX IF EXISTS ix_admins_status")
         with op.batch_alter_table("admins", recreate="always") as batch_op:
@@ -50,7 +66,6 @@ def upgrade() -> None:
             batch_op.create_index("ix_admins_username", ["username"], unique=False)
             batch_op.create_index("ix_admins_status", ["status"], unique=False)
     else:
-        inspector = sa.inspect(bind)
         for constraint in inspector.get_unique_constraints("admins"):
             if constraint.get("column_names") == ["username"]:
                 op.drop_constraint(constraint["name"], "admins", type_="unique")
@@ -76,27 +91,19 @@ def upgrade() -> None:
                 pass
             existing_indexes.pop(index_to_drop, None)
 
-        inspector = sa.inspect(bind)
+        # The inspector caches what it reflected; forget it after the DDL above instead of rebuilding it
+        inspector.clear_cache()
         refreshed_indexes = {idx["name"]: idx for idx in inspector.get_indexes("admins")}
 
         if "ix_admins_username" not in refreshed_indexes:
-            try:
-                op.create_index("ix_admins_username", "admins", ["username"], unique=False)
-            except Exception as e:
-                error_msg = str(e).lower()
-                if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                    raise
+            _create_index_if_absent(bind, "ix_admins_username", "admins", ["username"])
         if "ix_admins_status" not in refreshed_indexes:
-            try:
-                op.create_index("ix_admins_status", "admins", ["status"], unique=False)
-            except Exception as e:
-                error_msg = str(e).lower()
-                if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                    raise
-
-    if needs_status_column:
-        op.execute("UPDATE admins SET status = 'active' WHERE status IS NULL")
+            _create_index_if_absent(bind, "ix_admins_status", "admins", ["status"])
 
+    if needs_status_column and dialect != "sqlite":
+        # The NOT NULL column was added with server_default="active", so existing rows already hold it;
+        # only the default itself needs to go. On SQLite that would be a second full copy of the table,
+        # so the (harmless) default is kept there.
         with op.batch_alter_table("admins") as batch_op:
             batch_op.alter_column("status", server_default=None)
 
@@ -134,19 +141,12 @@ def downgrade() -> None:
         with op.batch_alter_table("admins") as batch_op:
             batch_op.drop_column("status")
         # Recreate a unique username index if it does not already exist
-        inspector = sa.inspect(bind)
+        inspector.clear_cache()
         existing_indexes = {idx["name"]: idx for idx in inspector.get_indexes("admins")}
         if not any(
             idx.get("column_names") == ["username"] and idx.get("unique")
             for idx in existing_indexes.values()
         ):
-            try:
-                op.create_index("ix_admins_username", "admins", ["username"], unique=True)
-            except Exception as e:
-                # Index might already exist, check if it's a duplicate key error
-                error_msg = str(e).lower()
-                if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                    # Re-raise if it's a different error
-                    raise
+            _create_index_if_absent(bind, "ix_admins_username", "admins", ["username"], unique=True)
 
     ADMIN_STATUS_ENUM.drop(bind, checkfirst=True)
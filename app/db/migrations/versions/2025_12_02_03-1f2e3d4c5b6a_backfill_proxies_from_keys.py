@@ -12,7 +12,7 @@ import sqlalchemy as sa
 from sqlalchemy.orm import Session
 
 from app.models.proxy import ProxyTypes
-from app.utils.credentials import runtime_proxy_settings
+from app.utils.credentials import UUID_PROTOCOLS, key_to_uuid, runtime_proxy_settings
 
 # revision identifiers, used by Alembic.
 revision = "1f2e3d4c5b6a"
@@ -20,9 +20,32 @@ down_revision = "0b71839bf061"
 branch_labels = None
 depends_on = None
 
+BATCH_SIZE = 1000
+
+
+def _load_uuid_masks(bind):
+    """Read the UUID masks once through the migration's own connection.
+
+    Returns None (so runtime_proxy_settings loads them itself) when this schema has no masks yet.
+    """
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("jwt"):
+        return None
+    columns = {column["name"] for column in inspector.get_columns("jwt")}
+    if not {"vmess_mask", "vless_mask"} <= columns:
+        return None
+    row = bind.execute(sa.text("SELECT vmess_mask, vless_mask FROM jwt LIMIT 1")).first()
+    if not row or not row[0] or not row[1]:
+        return None
+    return {ProxyTypes.VMess: bytes.fromhex(row[0]), ProxyTypes.VLESS: bytes.fromhex(row[1])}
+
 
 def upgrade() -> None:
     bind = op.get_bind()
+    # Fresh installs have nothing to backfill; don't reflect the schema for them
+    if bind.execute(sa.text("SELECT 1 FROM users WHERE credential_key IS NOT NULL LIMIT 1")).first() is None:
+        return
+
     metadata = sa.MetaData()
     metadata.reflect(bind=bind, only=("users", "proxies"))
 
@@ -31,34 +54,52 @@ def upgrade() -> None:
     if users_table is None or proxies_table is None:
         return
 
+    # Keyed proxies are read in id-ordered pages of a single join and each page is written back
+    # with one executemany, instead of a SELECT per user and an UPDATE per proxy
+    select_stmt = (
+        sa.select(
+            proxies_table.c.id,
+            proxies_table.c.type,
+            proxies_table.c.settings,
+            users_table.c.credential_key,
+        )
+        .join(users_table, users_table.c.id == proxies_table.c.user_id)
+        .where(users_table.c.credential_key.isnot(None))
+        .order_by(proxies_table.c.id)
+        .limit(BATCH_SIZE)
+    )
+    update_stmt = (
+        proxies_table.update()
+        .where(proxies_table.c.id == sa.bindparam("b_id"))
+        .values(settings=sa.bindparam("b_settings"))
+    )
+
+    # Deriving a UUID would otherwise open a new session per proxy just to read the masks
+    uuid_masks = _load_uuid_masks(bind)
+    proxy_types_by_value = {member.value: member for member in ProxyTypes}
+
     session = Session(bind=bind)
     try:
-        keyed_users = session.execute(
-            sa.select(
-                users_table.c.id,
-                users_table.c.credential_key,
-            ).where(users_table.c.credential_key.isnot(None))
-        ).all()
-
-        for user_row in keyed_users:
-            user_id = user_row.id
-            credential_key = user_row.credential_key
-            if not credential_key:
-                continue
-
-            proxy_rows = session.execute(
-                sa.select(
-                    proxies_table.c.id,
-                    proxies_table.c.type,
-                    proxies_table.c.settings,
-                ).where(proxies_table.c.user_id == user_id)
-            ).all()
-
+        last_id = None
+        while True:
+            page_stmt = select_stmt if last_id is None else select_stmt.where(proxies_table.c.id > last_id)
+            proxy_rows = session.execute(page_stmt).all()
+            if not proxy_rows:
+                break
+            last_id = proxy_rows[-1].id
+
+            params = []
             for proxy_row in proxy_rows:
+                credential_key = proxy_row.credential_key
+                if not credential_key:
+                    continue
+
                 proxy_type_val = proxy_row.type
-                try:
-                    proxy_type = proxy_type_val if isinstance(proxy_type_val, ProxyTypes) else ProxyTypes(proxy_type_val)
-                except Exception:
+                if isinstance(proxy_type_val, ProxyTypes):
+                    proxy_type = proxy_type_val
+                else:
+                    proxy_type = proxy_types_by_value.get(proxy_type_val)
+                if proxy_type is None:
                     continue
 
                 settings_data = dict(proxy_row.settings or {})
@@ -66,17 +107,18 @@ def upgrade() -> None:
                     settings_data.pop(cred_key, None)
 
                 try:
+                    if uuid_masks is not None and proxy_type in UUID_PROTOCOLS:
+                        settings_data["id"] = str(key_to_uuid(credential_key, proxy_type, masks=uuid_masks))
                     runtime_settings = runtime_proxy_settings(
                         settings_data, proxy_type, credential_key
                     )
                 except Exception:
                     continue
 
-                session.execute(
-                    proxies_table.update()
-                    .where(proxies_table.c.id == proxy_row.id)
-                    .values(settings=runtime_settings)
-                )
+                params.append({"b_id": proxy_row.id, "b_settings": runtime_settings})
+
+            if params:
+                session.execute(update_stmt, params)
         session.commit()
     finally:
         session.close()
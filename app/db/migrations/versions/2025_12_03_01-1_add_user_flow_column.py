@@ -17,6 +17,75 @@ down_revision = "1f2e3d4c5b6a"
 branch_labels = None
 depends_on = None
 
+BATCH_SIZE = 1000
+
+
+def _any_row(bind, query: str) -> bool:
+    return bind.execute(sa.text(query)).first() is not None
+
+
+def _sqlite_has_json(bind) -> bool:
+    # JSON functions are built into SQLite since 3.38; older builds may lack the JSON1 extension
+    version = getattr(bind.dialect.dbapi, "sqlite_version_info", (0,))
+    return tuple(version) >= (3, 38)
+
+
+def _backfill_user_flow_in_batches(bind) -> None:
+    metadata = sa.MetaData()
+    metadata.reflect(bind=bind, only=("users", "proxies"))
+    users_table = metadata.tables["users"]
+    proxies_table = metadata.tables["proxies"]
+
+    select_stmt = (
+        sa.select(proxies_table.c.id, proxies_table.c.user_id, proxies_table.c.settings)
+        .order_by(proxies_table.c.id)
+        .limit(BATCH_SIZE)
+    )
+    proxy_update = (
+        proxies_table.update()
+        .where(proxies_table.c.id == sa.bindparam("b_id"))
+        .values(settings=sa.bindparam("b_settings"))
+    )
+    user_update = (
+        users_table.update()
+        .where(users_table.c.id == sa.bindparam("b_id"), users_table.c.flow.is_(None))
+        .values(flow=sa.bindparam("b_flow"))
+    )
+
+    # First non-empty flow per user, by proxy id
+    user_flows = {}
+    session = Session(bind=bind)
+    try:
+        last_id = None
+        while True:
+            page_stmt = select_stmt if last_id is None else select_stmt.where(proxies_table.c.id > last_id)
+            proxy_rows = session.execute(page_stmt).all()
+            if not proxy_rows:
+                break
+            last_id = proxy_rows[-1].id
+
+            params = []
+            for proxy_row in proxy_rows:
+                settings = dict(proxy_row.settings or {})
+                if "flow" not in settings:
+                    continue
+                proxy_flow = settings.pop("flow")
+                if proxy_flow and proxy_row.user_id not in user_flows:
+                    user_flows[proxy_row.user_id] = proxy_flow
+                params.append({"b_id": proxy_row.id, "b_settings": settings})
+            if params:
+                session.execute(proxy_update, params)
+
+        flows = list(user_flows.items())
+        for start in range(0, len(flows), BATCH_SIZE):
+            session.execute(
+                user_update,
+                [{"b_id": user_id, "b_flow": flow} for user_id, flow in flows[start : start + BATCH_SIZE]],
+            )
+        session.commit()
+    finally:
+        session.close()
+
 
 def upgrade() -> None:
     # Use batch_alter_table for SQLite compatibility (DROP/ADD handled safely)
@@ -26,7 +95,10 @@ def upgrade() -> None:
     bind = op.get_bind()
     dialect = bind.dialect.name
 
+    # Each path below is skipped when no proxy carries a flow (fresh installs, re-runs)
     if dialect == "mysql":
+        if not _any_row(bind, "SELECT 1 FROM proxies WHERE JSON_EXTRACT(settings, '$.flow') IS NOT NULL LIMIT 1"):
+            return
         # Fast path using MySQL JSON functions
         # 1) Backfill users.flow from proxies.settings.flow (any matching proxy per user is fine)
         op.execute(
@@ -53,27 +125,40 @@ def upgrade() -> None:
             WHERE JSON_EXTRACT(settings, '$.flow') IS NOT NULL
             """
         )
+    elif dialect == "sqlite" and _sqlite_has_json(bind):
+        if not _any_row(bind, "SELECT 1 FROM proxies WHERE json_type(settings, '$.flow') IS NOT NULL LIMIT 1"):
+            return
+        # Same fast path with SQLite's built-in JSON functions; the first non-empty flow by proxy id wins
+        op.execute(
+            """
+            UPDATE users
+            SET flow = (
+                SELECT json_extract(p.settings, '$.flow')
+                FROM proxies p
+                WHERE p.user_id = users.id
+                  AND json_extract(p.settings, '$.flow') IS NOT NULL
+                  AND json_extract(p.settings, '$.flow') != ''
+                ORDER BY p.id
+                LIMIT 1
+            )
+            WHERE flow IS NULL
+            """
+        )
+
+        # json_type (unlike json_extract) also matches a flow key holding JSON null
+        op.execute(
+            """
+            UPDATE proxies
+            SET settings = json_remove(settings, '$.flow')
+            WHERE json_type(settings, '$.flow') IS NOT NULL
+            """
+        )
     else:
-        # Fallback: small ORM loop (acceptable for dev/test SQLite)
-        session = Session(bind=bind)
-        try:
-            from app.db.models import User, Proxy
-
-            users = session.query(User).all()
-            for user in users:
-                flow_value = getattr(user, "flow", None)
-                proxies = session.query(Proxy).filter(Proxy.user_id == user.id).all()
-                for proxy in proxies:
-                    settings = dict(proxy.settings or {})
-                    proxy_flow = settings.pop("flow", None)
-                    if not flow_value and proxy_flow:
-                        flow_value = proxy_flow
-                    proxy.settings = settings
-                if flow_value:
-                    user.flow = flow_value
-            session.commit()
-        finally:
-            session.close()
+        if not _any_row(bind, "SELECT 1 FROM proxies LIMIT 1"):
+            return
+        # Fallback for other dialects and older SQLite builds: the same two steps through Core,
+        # reading proxies in id-ordered pages and writing each page back with one executemany
+        _backfill_user_flow_in_batches(bind)
 
 
 def downgrade() -> None:
@@ -0,0 +1,58 @@
+"""add covering indexes for usage reports
+
+Revision ID: 4_add_usage_covering_indexes
+Revises: 3_add_access_insights
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4_add_usage_covering_indexes'
+down_revision = '3_add_access_insights'
+branch_labels = None
+depends_on = None
+
+
+# Usage reports filter node_user_usages by user (or node) and a created_at window, then sum
+# used_traffic grouped by node and/or hour. Carrying used_traffic in the index lets those
+# queries be answered from the index alone instead of visiting every matching table row.
+INDEXES = (
+    ("ix_node_user_usages_user_created_node", ["user_id", "created_at", "node_id"], ["used_traffic"]),
+    ("ix_node_user_usages_node_created", ["node_id", "created_at"], ["used_traffic", "user_id"]),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    existing = {idx["name"] for idx in sa.inspect(bind).get_indexes("node_user_usages")}
+    missing = [index for index in INDEXES if index[0] not in existing]
+    if not missing:
+        return
+
+    if dialect == "postgresql":
+        # Build without blocking the usage recorder, which writes to this table every cycle.
+        with op.get_context().autocommit_block():
+            for name, columns, included in missing:
+                op.create_index(
+                    name,
+                    "node_user_usages",
+                    columns,
+                    unique=False,
+                    postgresql_include=included,
+                    postgresql_concurrently=True,
+                )
+    else:
+        # No INCLUDE clause outside PostgreSQL: append the covered columns to the key instead.
+        for name, columns, included in missing:
+            op.create_index(name, "node_user_usages", columns + included, unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    existing = {idx["name"] for idx in sa.inspect(bind).get_indexes("node_user_usages")}
+    for name, _, _ in reversed(INDEXES):
+        if name in existing:
+            op.drop_index(name, table_name="node_user_usages")
@@ -0,0 +1,73 @@
+"""add lower(username) expression index
+
+Revision ID: 5_add_username_lower_index
+Revises: 4_add_usage_covering_indexes
+Create Date: 2026-10-15 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5_add_username_lower_index'
+down_revision = '4_add_usage_covering_indexes'
+branch_labels = None
+depends_on = None
+
+
+INDEX_NAME = "ix_users_username_lower"
+
+# User lookups (get_user, create_user's duplicate check, the Redis adapter) filter on
+# lower(username) = :name because MySQL stores usernames with a binary collation. Without an
+# expression index that predicate cannot use ix_users_username and scans the whole table.
+# The index is not unique: soft-deleted users keep their username.
+
+
+def _supports_expression_index(bind) -> bool:
+    dialect = bind.dialect
+    if dialect.name != "mysql":
+        return True
+    # Functional key parts need MySQL 8.0.13+; MariaDB has none.
+    if getattr(dialect, "is_mariadb", False):
+        return False
+    return (dialect.server_version_info or (0,)) >= (8, 0, 13)
+
+
+def _index_exists(bind) -> bool:
+    # The inspector skips expression-based indexes on some dialects, so ask the catalog directly.
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        query = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = :name"
+    elif dialect == "mysql":
+        query = (
+            "SELECT COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = :name"
+        )
+    elif dialect == "postgresql":
+        query = "SELECT COUNT(*) FROM pg_indexes WHERE tablename = 'users' AND indexname = :name"
+    else:
+        return INDEX_NAME in {idx["name"] for idx in sa.inspect(bind).get_indexes("users")}
+    return bool(bind.execute(sa.text(query), {"name": INDEX_NAME}).scalar())
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if not _supports_expression_index(bind) or _index_exists(bind):
+        return
+
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(
+                INDEX_NAME,
+                "users",
+                [sa.text("lower(username)")],
+                unique=False,
+                postgresql_concurrently=True,
+            )
+    else:
+        op.create_index(INDEX_NAME, "users", [sa.text("lower(username)")], unique=False)
+
+
+def downgrade() -> None:
+    if _index_exists(op.get_bind()):
+        op.drop_index(INDEX_NAME, table_name="users")
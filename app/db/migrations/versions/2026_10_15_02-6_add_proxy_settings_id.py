@@ -0,0 +1,55 @@
+"""add generated settings_id column to proxies
+
+Revision ID: 6_add_proxy_settings_id
+Revises: 5_add_username_lower_index
+Create Date: 2026-10-15 02:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '6_add_proxy_settings_id'
+down_revision = '5_add_username_lower_index'
+branch_labels = None
+depends_on = None
+
+
+INDEX_NAME = "ix_proxies_settings_id"
+
+# UUID searches match users through proxies.settings->id. Extracting that from JSON on every row
+# cannot use an index, so expose it as a generated column and index it. The expression is rendered
+# per dialect from the same JSON accessor the model uses; the column is virtual on MySQL/SQLite and
+# stored on PostgreSQL, which has no virtual generated columns.
+
+
+def _settings_id_column() -> sa.Column:
+    settings = sa.Column("settings", sa.JSON)
+    return sa.Column("settings_id", sa.String(64), sa.Computed(settings["id"].as_string()))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {column["name"] for column in inspector.get_columns("proxies")}
+    if "settings_id" not in columns:
+        op.add_column("proxies", _settings_id_column())
+
+    existing = {idx["name"] for idx in sa.inspect(bind).get_indexes("proxies")}
+    if INDEX_NAME in existing:
+        return
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX_NAME, "proxies", ["settings_id"], unique=False, postgresql_concurrently=True)
+    else:
+        op.create_index(INDEX_NAME, "proxies", ["settings_id"], unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    existing = {idx["name"] for idx in sa.inspect(bind).get_indexes("proxies")}
+    if INDEX_NAME in existing:
+        op.drop_index(INDEX_NAME, table_name="proxies")
+    columns = {column["name"] for column in sa.inspect(bind).get_columns("proxies")}
+    if "settings_id" in columns:
+        op.drop_column("proxies", "settings_id")
@@ -0,0 +1,51 @@
+"""cascade user deletes to usage rows
+
+Revision ID: 7_cascade_user_usage_deletes
+Revises: 6_add_proxy_settings_id
+Create Date: 2026-10-15 03:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7_cascade_user_usage_deletes'
+down_revision = '6_add_proxy_settings_id'
+branch_labels = None
+depends_on = None
+
+
+# Deleting a user used to need one DELETE per usage table (or an ORM walk over every usage row)
+# before the user row itself. With ON DELETE CASCADE the database removes them together.
+# SQLite is skipped: the app does not enable foreign key enforcement there, so the cascade would
+# never fire and usage rows are still removed explicitly.
+TABLES = ("node_user_usages", "user_usage_logs")
+
+
+def _constraint_name(table: str) -> str:
+    return f"fk_{table}_user_id"
+
+
+def _replace_user_fk(table: str, ondelete) -> None:
+    inspector = sa.inspect(op.get_bind())
+    for fk in inspector.get_foreign_keys(table):
+        if fk.get("referred_table") == "users" and fk.get("constrained_columns") == ["user_id"]:
+            if (fk.get("options") or {}).get("ondelete") == ondelete:
+                return
+            if fk.get("name"):
+                op.drop_constraint(fk["name"], table, type_="foreignkey")
+    op.create_foreign_key(_constraint_name(table), table, "users", ["user_id"], ["id"], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        return
+    for table in TABLES:
+        _replace_user_fk(table, "CASCADE")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        return
+    for table in TABLES:
+        _replace_user_fk(table, None)
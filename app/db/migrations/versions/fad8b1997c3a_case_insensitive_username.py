@@ -9,7 +9,6 @@ Create Date: 2023-03-17 22:46:32.833004
 from alembic import op
 import sqlalchemy as sa
 from sqlalchemy.sql import func, select, update
-import pymysql
 
 # revision identifiers, used by Alembic.
 revision = 'fad8b1997c3a'
@@ -17,6 +16,31 @@ down_revision = '5b84d88804a1'
 branch_labels = None
 depends_on = None
 
+DEDUPLICATE_USERNAMES_SQL = """
+    UPDATE users
+    SET username = users.username || '_' || d.rn
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY username COLLATE NOCASE ORDER BY id) - 1 AS rn
+        FROM users
+    ) AS d
+    WHERE users.id = d.id AND d.rn > 0
+"""
+
+
+def _create_index_if_absent(bind, name, table, columns, unique=False) -> None:
+    # PostgreSQL, SQLite and MariaDB skip an existing index at the DDL level. MySQL has no
+    # CREATE INDEX IF NOT EXISTS, so a duplicate (error 1061) is tolerated there instead.
+    dialect = bind.dialect
+    if dialect.name != 'mysql' or getattr(dialect, 'is_mariadb', False):
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+        return
+    try:
+        op.create_index(name, table, columns, unique=unique)
+    except sa.exc.DBAPIError as e:
+        error_msg = str(e).lower()
+        if 'duplicate' not in error_msg and '1061' not in error_msg:
+            raise
+
 
 def upgrade() -> None:
     bind = op.get_bind()
@@ -28,7 +52,7 @@ def upgrade() -> None:
         # But we need to ensure the index exists
         # Check directly in MySQL information_schema to be sure (more reliable than inspector)
         try:
-            result = bind.execute(
+            exists = bind.execute(
                 sa.text("""
                     SELECT COUNT(*) as cnt 
                     FROM information_schema.statistics 
@@ -36,83 +60,12 @@ def upgrade() -> None:
                     AND table_name = 'users' 
                     AND index_name = 'ix_users_username'
                 """)
-            ).scalar()
-            
-            if result == 0:
-                # Index doesn't exist, try to create it
-                try:
-                    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
-                except Exception as e:
-                    # Check for duplicate key error (MySQL error 1061)
-                    # SQLAlchemy wraps pymysql errors, so check both the message and the original error
-                    error_msg = str(e).lower()
-                    error_repr = repr(e).lower()
-                    
-                    # Check error message and representation for duplicate key indicators
-                    is_duplicate_error = (
-                        'duplicate' in error_msg or 
-                        'duplicate' in error_repr or
-                        'already exists' in error_msg or 
-                        '1061' in error_msg or
-                        '1061' in error_repr or
-                        'ix_users_username' in error_msg
-                    )
-                    
-                    # Check original error if wrapped by SQLAlchemy
-                    if not is_duplicate_error and hasattr(e, 'orig'):
-                        orig = e.orig
-                        if isinstance(orig, (pymysql.err.OperationalError,)):
-                            if hasattr(orig, 'args') and len(orig.args) > 0:
-                                # pymysql format: (1061, "Duplicate key name 'ix_users_username'")
-                                if isinstance(orig.args[0], tuple) and len(orig.args[0]) > 0:
-                                    if orig.args[0][0] == 1061:
-                                        is_duplicate_error = True
-                                elif isinstance(orig.args[0], int) and orig.args[0] == 1061:
-                                    is_duplicate_error = True
-                    
-                    # If it's not a duplicate error, re-raise
-                    if not is_duplicate_error:
-                        raise
-                    # Otherwise, silently ignore (index already exists)
-        except Exception as schema_error:
+            ).scalar() > 0
+        except Exception:
             # If information_schema query fails, fall back to inspector
-            inspector = sa.inspect(bind)
-            existing_indexes = {index['name'] for index in inspector.get_indexes('users')}
-            if 'ix_users_username' not in existing_indexes:
-                try:
-                    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
-                except Exception as create_error:
-                    # Check for duplicate key error (MySQL error 1061)
-                    # SQLAlchemy wraps pymysql errors, so check both the message and the original error
-                    error_msg = str(create_error).lower()
-                    error_repr = repr(create_error).lower()
-                    
-                    # Check error message and representation for duplicate key indicators
-                    is_duplicate_error = (
-                        'duplicate' in error_msg or 
-                        'duplicate' in error_repr or
-                        'already exists' in error_msg or 
-                        '1061' in error_msg or
-                        '1061' in error_repr or
-                        'ix_users_username' in error_msg
-                    )
-                    
-                    # Check original error if wrapped by SQLAlchemy
-                    if not is_duplicate_error and hasattr(create_error, 'orig'):
-                        orig = create_error.orig
-                        if isinstance(orig, (pymysql.err.OperationalError,)):
-                            if hasattr(orig, 'args') and len(orig.args) > 0:
-                                # pymysql format: (1061, "Duplicate key name 'ix_users_username'")
-                                if isinstance(orig.args[0], tuple) and len(orig.args[0]) > 0:
-                                    if orig.args[0][0] == 1061:
-                                        is_duplicate_error = True
-                                elif isinstance(orig.args[0], int) and orig.args[0] == 1061:
-                                    is_duplicate_error = True
-                    
-                    # If it's not a duplicate error, re-raise
-                    if not is_duplicate_error:
-                        raise
-                    # Otherwise, silently ignore (index already exists)
+            exists = 'ix_users_username' in existing_indexes
+        if not exists:
+            _create_index_if_absent(bind, op.f('ix_users_username'), 'users', ['username'], unique=True)
         return
 
     elif bind.engine.name == 'sqlite':
@@ -122,14 +75,7 @@ def upgrade() -> None:
         if table_sql and 'COLLATE NOCASE' in table_sql.upper():
             # Index might already exist, check and create if needed
             if 'ix_users_username' not in existing_indexes:
-                try:
-                    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
-                except Exception as e:
-                    # Index might already exist, check if it's a duplicate key error
-                    error_msg = str(e).lower()
-                    if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                        # Re-raise if it's a different error
-                        raise
+                _create_index_if_absent(bind, op.f('ix_users_username'), 'users', ['username'], unique=True)
             return
 
         if 'ix_users_username' in existing_indexes:
@@ -138,9 +84,6 @@ def upgrade() -> None:
             except Exception:
                 # Index might not exist, continue
                 pass
-            # Refresh inspector after drop
-            inspector = sa.inspect(bind)
-            existing_indexes = {index['name'] for index in inspector.get_indexes('users')}
 
         # Define the 'users' table for SQLAlchemy Core operations
         users_table = sa.Table(
@@ -153,55 +96,45 @@ def upgrade() -> None:
         # Identify and resolve duplicate usernames with a case-insensitive check
         connection = op.get_bind()
 
-        while True:
-            # Use SQLAlchemy Core to find duplicates with COLLATE NOCASE
-            duplicate_query = (
-                select(users_table.c.username, func.count())
-                .group_by(users_table.c.username.collate("NOCASE"))
-                .having(func.count() > 1)
-            )
-            duplicates = connection.execute(duplicate_query).fetchall()
-
-            if not duplicates:
-                break  # No duplicates, exit the loop
-
-            # Resolve duplicates
-            for username, count in duplicates:
-                # Update rows with duplicate usernames
-                update_stmt = (
-                    update(users_table)
-                    .where(users_table.c.username == username)
-                    .values(username=f"{username}_{count}")
-                )
-                connection.execute(update_stmt)
-
-        # Alter column to enforce case-insensitivity
+        # Use SQLAlchemy Core to find duplicates with COLLATE NOCASE
+        duplicate_query = (
+            select(users_table.c.username, func.count())
+            .group_by(users_table.c.username.collate("NOCASE"))
+            .having(func.count() > 1)
+        )
+
+        if connection.dialect.dbapi.sqlite_version_info >= (3, 33):
+            # Suffix every duplicate but the oldest in one statement; repeat only if a new name
+            # happens to collide with an existing one
+            while connection.execute(duplicate_query.limit(1)).first():
+                connection.execute(sa.text(DEDUPLICATE_USERNAMES_SQL))
+        else:
+            # UPDATE ... FROM needs SQLite 3.33+
+            while True:
+                duplicates = connection.execute(duplicate_query).fetchall()
+
+                if not duplicates:
+                    break  # No duplicates, exit the loop
+
+                # Resolve duplicates
+                for username, count in duplicates:
+                    # Update rows with duplicate usernames
+                    update_stmt = (
+                        update(users_table)
+                        .where(users_table.c.username == username)
+                        .values(username=f"{username}_{count}")
+                    )
+                    connection.execute(update_stmt)
+
+        # Alter column to enforce case-insensitivity and rebuild the unique index (dropped above) in the
+        # same table copy
         with op.batch_alter_table('users') as batch_op:
             batch_op.alter_column('username', type_=sa.String(length=34, collation='NOCASE'))
-
-        # Recreate the unique index (check if it doesn't exist)
-        inspector = sa.inspect(bind)
-        existing_indexes = {index['name'] for index in inspector.get_indexes('users')}
-        if 'ix_users_username' not in existing_indexes:
-            try:
-                op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
-            except Exception as e:
-                # Index might already exist, check if it's a duplicate key error
-                error_msg = str(e).lower()
-                if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                    # Re-raise if it's a different error
-                    raise
+            batch_op.create_index(op.f('ix_users_username'), ['username'], unique=True)
     else:
         # For other databases (PostgreSQL, etc.), check if index exists before creating
         if 'ix_users_username' not in existing_indexes:
-            try:
-                op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
-            except Exception as e:
-                # Index might already exist, check if it's a duplicate key error
-                error_msg = str(e).lower()
-                if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                    # Re-raise if it's a different error
-                    raise
+            _create_index_if_absent(bind, op.f('ix_users_username'), 'users', ['username'], unique=True)
 
 
 def downgrade() -> None:
@@ -232,22 +165,8 @@ def downgrade() -> None:
         inspector = sa.inspect(bind)
         existing_indexes = {index['name'] for index in inspector.get_indexes('users')}
         if 'ix_users_username' not in existing_indexes:
-            try:
-                op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
-            except Exception as e:
-                # Index might already exist, check if it's a duplicate key error
-                error_msg = str(e).lower()
-                if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                    # Re-raise if it's a different error
-                    raise
+            _create_index_if_absent(bind, op.f('ix_users_username'), 'users', ['username'], unique=True)
     else:
         # For other databases, ensure index exists
         if 'ix_users_username' not in existing_indexes:
-            try:
-                op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
-            except Exception as e:
-                # Index might already exist, check if it's a duplicate key error
-                error_msg = str(e).lower()
-                if 'duplicate' not in error_msg and 'already exists' not in error_msg:
-                    # Re-raise if it's a different error
-                    raise
+            _create_index_if_absent(bind, op.f('ix_users_username'), 'users', ['username'], unique=True)
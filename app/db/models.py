@@ -6,6 +6,7 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Computed,
     DateTime,
     Enum,
     Float,
@@ -139,14 +140,18 @@ class User(Base):
     proxies = relationship("Proxy", back_populates="user", cascade="all, delete-orphan")
     status = Column(Enum(UserStatus), nullable=False, default=UserStatus.active)
     used_traffic = Column(BigInteger, default=0)
-    node_usages = relationship("NodeUserUsage", back_populates="user", cascade="all, delete-orphan")
+    node_usages = relationship(
+        "NodeUserUsage", back_populates="user", cascade="all, delete-orphan", passive_deletes=True
+    )
     data_limit = Column(BigInteger, nullable=True)
     data_limit_reset_strategy = Column(
         Enum(UserDataLimitResetStrategy),
         nullable=False,
         default=UserDataLimitResetStrategy.no_reset,
     )
-    usage_logs = relationship("UserUsageResetLogs", back_populates="user")  # maybe rename it to reset_usage_logs?
+    usage_logs = relationship(
+        "UserUsageResetLogs", back_populates="user", cascade="all, delete", passive_deletes=True
+    )  # maybe rename it to reset_usage_logs?
     expire = Column(Integer, nullable=True)
     admin_id = Column(Integer, ForeignKey("admins.id"))
     admin = relationship("Admin", back_populates="users")
@@ -276,7 +281,7 @@ class UserUsageResetLogs(Base):
     __tablename__ = "user_usage_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     user = relationship("User", back_populates="usage_logs")
     used_traffic_at_reset = Column(BigInteger, nullable=False)
     reset_at = Column(DateTime, default=utcnow)
@@ -290,6 +295,8 @@ class Proxy(Base):
     user = relationship("User", back_populates="proxies")
     type = Column(Enum(ProxyTypes), nullable=False)
     settings = Column(JSON, nullable=False)
+    # Generated from settings["id"] so UUID lookups can use an index instead of parsing JSON per row
+    settings_id = Column(String(64), Computed(settings["id"].as_string()), index=True)
     excluded_inbounds = relationship("ProxyInbound", secondary=excluded_inbounds_association)
 
 
@@ -524,7 +531,7 @@ class NodeUserUsage(Base):
 
     id = Column(Integer, primary_key=True)
     created_at = Column(DateTime, unique=False, nullable=False)  # one hour per record
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     user = relationship("User", back_populates="node_usages")
     node_id = Column(Integer, ForeignKey("nodes.id"))
     node = relationship("Node", back_populates="user_usages")
@@ -251,6 +251,7 @@ def sync_user_changes_to_db():
         logger.info(f"Syncing {len(pending_user_ids)} user changes from Redis to database...")
 
         synced_count = 0
+        synced_at = datetime.now(timezone.utc)
         with GetDB() as db:
             for user_id in pending_user_ids:
                 try:
@@ -294,7 +295,7 @@ def sync_user_changes_to_db():
                             new_status = UserStatus(user_data["status"])
                             if db_user.status != new_status:
                                 db_user.status = new_status
-                                db_user.last_status_change = datetime.now(timezone.utc)
+                                db_user.last_status_change = synced_at
                         except Exception:
                             pass
 
@@ -275,7 +275,12 @@ def remove_user(dbuser: "DBUser"):
     dbuser = _prepare_user_for_runtime(dbuser)
     if not dbuser:
         return
-    email = f"{dbuser.id}.{dbuser.username}"
+    remove_user_by_id(dbuser.id, dbuser.username)
+
+
+def remove_user_by_id(user_id: int, username: str):
+    """Remove a user from every inbound; only the id and username make up the Xray email."""
+    email = f"{user_id}.{username}"
 
     for inbound_tag in state.config.inbounds_by_tag:
         _remove_user_from_inbound(state.api, inbound_tag, email)
@@ -199,8 +199,8 @@ def _deserialize_user(user_dict: Dict[str, Any], db: Optional[Any] = None) -> Op
             pass  # If inspection fails, object is already detached
 
         user.username = user_dict.get("username")
-        if user_dict.get("status"):
-            user.status = UserStatus(user_dict["status"])
+        # Always set: in-memory filters read status directly (users.status is NOT NULL in the DB)
+        user.status = UserStatus(user_dict.get("status") or UserStatus.active.value)
         user.expire = user_dict.get("expire")
         user.data_limit = user_dict.get("data_limit")
         if user_dict.get("data_limit_reset_strategy"):
@@ -263,11 +263,16 @@ def _deserialize_user(user_dict: Dict[str, Any], db: Optional[Any] = None) -> Op
 
         # Deserialize proxies
         user.proxies = []
+        proxy_ids = set()
         for proxy_data in user_dict.get("proxies", []):
             proxy = ProxyModel(type=proxy_data["type"], settings=proxy_data["settings"])
             if proxy_data.get("excluded_inbounds"):
                 proxy.excluded_inbounds = [InboundModel(tag=tag) for tag in proxy_data["excluded_inbounds"]]
             user.proxies.append(proxy)
+            # Serialized settings are always dicts; collect their UUIDs once for in-memory search
+            if isinstance(proxy_data["settings"], dict) and proxy_data["settings"].get("id"):
+                proxy_ids.add(proxy_data["settings"]["id"])
+        user._proxy_ids = frozenset(proxy_ids)
 
         return user
     except Exception as e:
@@ -290,11 +295,20 @@ def cache_user(user: User, mark_for_sync: bool = True) -> bool:
         user_dict = _serialize_user(user)
         user_json = json.dumps(user_dict)
 
-        redis_client.setex(_get_user_id_key(user.id), USER_CACHE_TTL, user_json)
-        redis_client.setex(_get_user_key(user.username), USER_CACHE_TTL, user_json)
+        # The entries overwrite any previous ones, so no invalidation is needed beforehand. All
+        # writes and the aggregated list read share one round-trip.
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.setex(_get_user_id_key(user.id), USER_CACHE_TTL, user_json)
+        pipe.setex(_get_user_key(user.username), USER_CACHE_TTL, user_json)
+        # Mark user for sync to database if requested
+        if mark_for_sync and user.id:
+            pipe.setex(f"{REDIS_KEY_PREFIX_USER_PENDING_SYNC}{user.id}", USER_CACHE_TTL, user_json)
+            pipe.sadd(REDIS_KEY_USER_PENDING_SYNC_SET, str(user.id))
+        pipe.get(REDIS_KEY_USER_LIST_ALL)
+        pipe.ttl(REDIS_KEY_USER_LIST_ALL)
+        aggregated, ttl = pipe.execute()[-2:]
 
         # Incrementally update aggregated list if it exists
-        aggregated = redis_client.get(REDIS_KEY_USER_LIST_ALL)
         if aggregated:
             try:
                 data = json.loads(aggregated)
@@ -312,25 +326,69 @@ def cache_user(user: User, mark_for_sync: bool = True) -> bool:
             if not updated:
                 data.append(user_dict)
 
-            ttl = redis_client.ttl(REDIS_KEY_USER_LIST_ALL)
             ttl_value = ttl if ttl and ttl > 0 else USER_CACHE_TTL
             redis_client.setex(REDIS_KEY_USER_LIST_ALL, ttl_value, json.dumps(data))
 
-        # Mark user for sync to database if requested
-        if mark_for_sync and user.id:
-            try:
-                sync_key = f"{REDIS_KEY_PREFIX_USER_PENDING_SYNC}{user.id}"
-                redis_client.setex(sync_key, USER_CACHE_TTL, user_json)
-                redis_client.sadd(REDIS_KEY_USER_PENDING_SYNC_SET, str(user.id))
-            except Exception as e:
-                logger.debug(f"Failed to mark user {user.id} for sync: {e}")
-
         return True
     except Exception as e:
         logger.warning(f"Failed to cache user in Redis: {e}")
         return False
 
 
+def cache_users_bulk(users: Iterable[User], mark_for_sync: bool = True) -> int:
+    """Cache many users in one pipelined round-trip; the bulk counterpart of ``cache_user``.
+
+    The aggregated user list, when present, is read and rewritten once for the whole batch.
+    Returns the number of users cached.
+    """
+    redis_client = get_redis()
+    if not redis_client:
+        return 0
+
+    try:
+        entries = [(user, _serialize_user(user)) for user in users]
+        if not entries:
+            return 0
+
+        pipe = redis_client.pipeline(transaction=False)
+        sync_ids = []
+        for user, user_dict in entries:
+            user_json = json.dumps(user_dict)
+            pipe.setex(_get_user_id_key(user.id), USER_CACHE_TTL, user_json)
+            pipe.setex(_get_user_key(user.username), USER_CACHE_TTL, user_json)
+            if mark_for_sync and user.id:
+                pipe.setex(f"{REDIS_KEY_PREFIX_USER_PENDING_SYNC}{user.id}", USER_CACHE_TTL, user_json)
+                sync_ids.append(str(user.id))
+        if sync_ids:
+            pipe.sadd(REDIS_KEY_USER_PENDING_SYNC_SET, *sync_ids)
+        pipe.execute()
+
+        aggregated = redis_client.get(REDIS_KEY_USER_LIST_ALL)
+        if aggregated:
+            try:
+                data = json.loads(aggregated)
+                if not isinstance(data, list):
+                    data = []
+            except Exception:
+                data = []
+
+            pending = {user.id: user_dict for user, user_dict in entries}
+            for idx, item in enumerate(data):
+                replacement = pending.pop(item.get("id"), None)
+                if replacement is not None:
+                    data[idx] = replacement
+            data.extend(pending.values())
+
+            ttl = redis_client.ttl(REDIS_KEY_USER_LIST_ALL)
+            ttl_value = ttl if ttl and ttl > 0 else USER_CACHE_TTL
+            redis_client.setex(REDIS_KEY_USER_LIST_ALL, ttl_value, json.dumps(data))
+
+        return len(entries)
+    except Exception as e:
+        logger.warning(f"Failed to cache users in Redis: {e}")
+        return 0
+
+
 def get_cached_user(
     username: Optional[str] = None, user_id: Optional[int] = None, db: Optional[Any] = None
 ) -> Optional[User]:
@@ -365,7 +423,8 @@ def get_cached_user(
         if user_id is not None:
             query = query.filter(User.id == user_id)
         elif username:
-            query = query.filter(func.lower(User.username) == username.lower())
+            # Soft-deleted users keep their username, so only a live user may answer a name lookup
+            query = query.filter(func.lower(User.username) == username.lower(), User.status != UserStatus.deleted)
         else:
             return None
 
@@ -594,14 +653,13 @@ def get_all_users_from_cache(db: Optional[Any] = None) -> List[User]:
                 logger.error(f"Failed to load users from database: {e}")
                 users = []
 
-        # Refresh aggregated list if we have anything
+        # Rebuild the aggregated list if we have anything; it was missing or unreadable, so it
+        # gets a fresh TTL and callers never need to write it back themselves
         if users:
             try:
-                ttl = redis_client.ttl(REDIS_KEY_USER_LIST_ALL)
-                ttl_value = ttl if ttl and ttl > 0 else USER_CACHE_TTL
                 redis_client.setex(
                     REDIS_KEY_USER_LIST_ALL,
-                    ttl_value,
+                    USER_CACHE_TTL,
                     json.dumps([_serialize_user(u) for u in users]),
                 )
             except Exception as exc:
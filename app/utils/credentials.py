@@ -3,7 +3,7 @@ import secrets
 import uuid
 import re
 from functools import lru_cache
-from typing import TYPE_CHECKING, Any, Dict, MutableMapping, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, Iterable, MutableMapping, Optional, Set, Union
 from uuid import UUID
 
 from app.models.proxy import ProxySettings, ProxyTypes, ShadowsocksMethods
@@ -13,8 +13,8 @@ if TYPE_CHECKING:
     from app.models.user import UserCreate
 
 
-UUID_PROTOCOLS = {ProxyTypes.VMess, ProxyTypes.VLESS}
-PASSWORD_PROTOCOLS = {ProxyTypes.Trojan, ProxyTypes.Shadowsocks}
+UUID_PROTOCOLS = frozenset({ProxyTypes.VMess, ProxyTypes.VLESS})
+PASSWORD_PROTOCOLS = frozenset({ProxyTypes.Trojan, ProxyTypes.Shadowsocks})
 
 
 def _get_uuid_masks() -> Dict[ProxyTypes, bytes]:
@@ -55,10 +55,14 @@ def normalize_key(key: str) -> str:
     return cleaned
 
 
-def key_to_uuid(key: str, proxy_type: ProxyTypes | None = None) -> uuid.UUID:
+def key_to_uuid(
+    key: str, proxy_type: ProxyTypes | None = None, masks: Dict[ProxyTypes, bytes] | None = None
+) -> uuid.UUID:
+    """Derive the UUID for ``key``; pass ``masks`` to skip loading them from the database."""
     normalized = normalize_key(key)
     key_bytes = bytearray.fromhex(normalized)
-    masks = get_protocol_uuid_masks()
+    if masks is None:
+        masks = get_protocol_uuid_masks()
     mask = masks.get(proxy_type)
     if mask:
         key_bytes = bytearray(_apply_mask(bytes(key_bytes), mask))
@@ -74,6 +78,17 @@ def uuid_to_key(value: uuid.UUID | str, proxy_type: ProxyTypes | None = None) ->
     return uuid_bytes.hex()
 
 
+def uuid_to_keys(value: uuid.UUID | str, proxy_types: Iterable[ProxyTypes]) -> Set[str]:
+    """Derive the credential keys ``value`` maps to under each of ``proxy_types``, loading the masks once."""
+    uuid_bytes = uuid.UUID(str(value)).bytes
+    masks = get_protocol_uuid_masks()
+    keys = set()
+    for proxy_type in proxy_types:
+        mask = masks.get(proxy_type)
+        keys.add((_apply_mask(uuid_bytes, mask) if mask else uuid_bytes).hex())
+    return keys
+
+
 def key_to_password(key: str, label: str) -> str:
     normalized = normalize_key(key)
     digest = hashlib.sha256(f"{label}:{normalized}".encode()).hexdigest()
@@ -107,10 +122,9 @@ def serialize_proxy_settings(
     data.pop("flow", None)
 
     if credential_key:
-        if proxy_type in UUID_PROTOCOLS:
-            derived_id = str(key_to_uuid(credential_key, proxy_type))
-            if not preserve_existing_uuid or not data.get("id"):
-                data["id"] = derived_id
+        # Deriving the UUID loads the masks from the database, so skip it when the stored one is kept
+        if proxy_type in UUID_PROTOCOLS and (not preserve_existing_uuid or not data.get("id")):
+            data["id"] = str(key_to_uuid(credential_key, proxy_type))
         if proxy_type in PASSWORD_PROTOCOLS:
             data.pop("password", None)
     else:
@@ -236,8 +250,9 @@ def runtime_proxy_settings(
     return data
 
 
+@lru_cache(maxsize=64)
 def _as_proxy_type(value: Union[str, ProxyTypes]) -> ProxyTypes:
-    """Convert a string or ProxyTypes to ProxyTypes enum."""
+    """Convert a string or ProxyTypes to ProxyTypes enum; memoized, it sits in per-proxy loops."""
     return value if isinstance(value, ProxyTypes) else ProxyTypes(value)
 
 
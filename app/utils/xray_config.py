@@ -90,6 +90,7 @@ def soft_reload_panel():
     logger.info("Generating Xray core config")
 
     # Reload config from database
+    crud.invalidate_xray_config_cache()
     with GetDB() as db:
         raw_config = crud.get_xray_config(db)
 
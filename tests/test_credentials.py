@@ -1,5 +1,18 @@
-from uuid import UUID
-from app.utils.credentials import generate_key, normalize_key, key_to_uuid, uuid_to_key, key_to_password
+from uuid import UUID, uuid4
+
+import app.utils.credentials as credentials
+from app.models.proxy import ProxyTypes
+from app.utils.credentials import (
+    UUID_PROTOCOLS,
+    generate_key,
+    normalize_key,
+    key_to_uuid,
+    uuid_to_key,
+    uuid_to_keys,
+    key_to_password,
+)
+
+MASKS = {ProxyTypes.VMess: bytes.fromhex("0f" * 16), ProxyTypes.VLESS: bytes.fromhex("a5" * 16)}
 
 
 def test_generate_key():
@@ -34,3 +47,26 @@ def test_key_to_password():
     password = key_to_password(key, "test")
     assert isinstance(password, str)
     assert len(password) > 0
+
+
+def test_key_to_uuid_with_preloaded_masks(monkeypatch):
+    key = "1234567890abcdef1234567890abcdef"
+    monkeypatch.setattr(credentials, "get_protocol_uuid_masks", lambda: MASKS)
+    loaded = {proxy_type: key_to_uuid(key, proxy_type) for proxy_type in UUID_PROTOCOLS}
+    for proxy_type, derived in loaded.items():
+        assert uuid_to_key(derived, proxy_type) == key
+
+    def fail():
+        raise AssertionError("masks should not be loaded when they are passed in")
+
+    monkeypatch.setattr(credentials, "get_protocol_uuid_masks", fail)
+    for proxy_type in UUID_PROTOCOLS:
+        assert key_to_uuid(key, proxy_type, masks=MASKS) == loaded[proxy_type]
+
+
+def test_uuid_to_keys_matches_uuid_to_key(monkeypatch):
+    monkeypatch.setattr(credentials, "get_protocol_uuid_masks", lambda: MASKS)
+    u = uuid4()
+    keys = uuid_to_keys(u, UUID_PROTOCOLS)
+    assert keys == {uuid_to_key(u, proxy_type) for proxy_type in UUID_PROTOCOLS}
+    assert len(keys) == len(UUID_PROTOCOLS)
@@ -1,9 +1,15 @@
+from datetime import datetime, timezone
 from uuid import uuid4
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+import pytest
 
 from tests.conftest import TestingSessionLocal
 from app.db import crud
+from app.db.exceptions import UsersLimitReachedError
+from app.db.models import Admin as DBAdmin, NodeUserUsage, User as DBUser, UserUsageResetLogs
+from app.models.user import UserStatus
 from app.db.crud.proxy import ProxyInboundRepository
 from app.models.proxy import ProxyHost
 from app.models.service import ServiceCreate, ServiceHostAssignment
@@ -200,6 +206,106 @@ def test_bulk_user_actions(auth_client: TestClient):
     assert response.status_code in [200, 422]
 
 
+def _create_admin_with_users(db, users_limit=None, **users):
+    admin = DBAdmin(username=f"bulk-{uuid4().hex[:8]}", users_limit=users_limit)
+    db.add(admin)
+    db.flush()
+    for name, fields in users.items():
+        db.add(DBUser(username=f"{admin.username}-{name}", admin_id=admin.id, **fields))
+    db.commit()
+    return admin
+
+
+def _users_by_name(db, admin):
+    db.expire_all()
+    return {user.username.rsplit("-", 1)[1]: user for user in db.query(DBUser).filter(DBUser.admin_id == admin.id)}
+
+
+def test_bulk_usage_adjustment_syncs_status():
+    with TestingSessionLocal() as db:
+        admin = _create_admin_with_users(
+            db,
+            plain=dict(status=UserStatus.active, used_traffic=100),
+            capped=dict(status=UserStatus.active, used_traffic=900, data_limit=1000),
+            limited=dict(status=UserStatus.limited, used_traffic=1200, data_limit=1000),
+            hold=dict(status=UserStatus.on_hold, used_traffic=0, data_limit=10**6),
+        )
+
+        assert crud.adjust_all_users_usage(db, 500, admin) == 4
+        users = _users_by_name(db, admin)
+        assert users["capped"].used_traffic == 1400
+        assert users["capped"].status == UserStatus.limited
+        assert users["limited"].status == UserStatus.limited
+        assert users["hold"].status == UserStatus.on_hold
+
+        crud.adjust_all_users_usage(db, -1000, admin)
+        users = _users_by_name(db, admin)
+        assert users["plain"].used_traffic == 0
+        assert users["capped"].status == UserStatus.active
+        assert users["limited"].used_traffic == 700
+        assert users["limited"].status == UserStatus.active
+        assert users["hold"].used_traffic == 0
+        assert users["hold"].status == UserStatus.on_hold
+
+
+def test_bulk_expire_and_limit_adjustments():
+    now = int(datetime.now(timezone.utc).timestamp())
+    with TestingSessionLocal() as db:
+        admin = _create_admin_with_users(
+            db,
+            soon=dict(status=UserStatus.active, expire=now + 3600),
+            later=dict(status=UserStatus.active, expire=now + 86400),
+        )
+        assert crud.adjust_all_users_expire(db, -7200, admin) == 2
+        users = _users_by_name(db, admin)
+        assert users["soon"].status == UserStatus.expired
+        assert users["later"].status == UserStatus.active
+        assert users["later"].expire == now + 86400 - 7200
+
+        admin = _create_admin_with_users(
+            db,
+            used=dict(status=UserStatus.active, used_traffic=500, data_limit=1000),
+            small=dict(status=UserStatus.active, used_traffic=0, data_limit=300),
+        )
+        assert crud.adjust_all_users_limit(db, -600, admin) == 2
+        users = _users_by_name(db, admin)
+        assert users["used"].data_limit == 400
+        assert users["used"].status == UserStatus.limited
+        assert users["small"].data_limit == 0
+        assert users["small"].status == UserStatus.active
+
+
+def test_activate_all_disabled_users_keeps_on_hold_users_on_hold():
+    with TestingSessionLocal() as db:
+        admin = _create_admin_with_users(
+            db,
+            waiting=dict(status=UserStatus.disabled, on_hold_expire_duration=3600),
+            regular=dict(status=UserStatus.disabled, expire=None),
+        )
+        crud.activate_all_disabled_users(db, admin)
+        users = _users_by_name(db, admin)
+        assert users["waiting"].status == UserStatus.on_hold
+        assert users["regular"].status == UserStatus.active
+
+
+def test_bulk_activation_respects_users_limit():
+    with TestingSessionLocal() as db:
+        admin = _create_admin_with_users(
+            db,
+            users_limit=2,
+            active=dict(status=UserStatus.active),
+            first=dict(status=UserStatus.disabled),
+            second=dict(status=UserStatus.disabled),
+        )
+        # One slot is left, but both disabled users would take one
+        with pytest.raises(UsersLimitReachedError):
+            crud.bulk_update_user_status(db, UserStatus.active, admin)
+        db.rollback()
+        users = _users_by_name(db, admin)
+        assert users["first"].status == UserStatus.disabled
+        assert users["second"].status == UserStatus.disabled
+
+
 def test_get_user_usage(auth_client: TestClient):
     # Create user first
     with patch(
@@ -301,3 +407,62 @@ def test_update_user_service_change(auth_client: TestClient):
     fetch_resp = auth_client.get(f"/api/user/{username}")
     assert fetch_resp.status_code == 200
     assert fetch_resp.json()["service_id"] == service_two_id
+
+
+def _add_usage_rows(db, user_ids):
+    for user_id in user_ids:
+        db.add(NodeUserUsage(user_id=user_id, created_at=datetime(2025, 1, 1), used_traffic=1))
+        db.add(UserUsageResetLogs(user_id=user_id, used_traffic_at_reset=1))
+    db.commit()
+
+
+def _usage_rows_left(db, user_ids):
+    return (
+        db.query(NodeUserUsage).filter(NodeUserUsage.user_id.in_(user_ids)).count(),
+        db.query(UserUsageResetLogs).filter(UserUsageResetLogs.user_id.in_(user_ids)).count(),
+    )
+
+
+def test_deleting_users_removes_usage_rows():
+    # SQLite does not enforce ON DELETE CASCADE here, so the delete path must remove usage rows itself
+    with TestingSessionLocal() as db:
+        admin = _create_admin_with_users(db, single=dict(status=UserStatus.active))
+        user_id = _users_by_name(db, admin)["single"].id
+        _add_usage_rows(db, [user_id])
+
+        crud.hard_delete_user(db, db.get(DBUser, user_id))
+        db.commit()
+        assert db.get(DBUser, user_id) is None
+        assert _usage_rows_left(db, [user_id]) == (0, 0)
+
+        service = _create_service_with_host(db, f"svc-{uuid4().hex[:6]}-purge")
+        admin = _create_admin_with_users(
+            db,
+            first=dict(status=UserStatus.active, service_id=service.id),
+            second=dict(status=UserStatus.active, service_id=service.id),
+        )
+        user_ids = [user.id for user in _users_by_name(db, admin).values()]
+        _add_usage_rows(db, user_ids)
+
+        crud.remove_service(db, service, mode="delete_users", unlink_admins=True)
+        assert db.query(DBUser).filter(DBUser.id.in_(user_ids)).count() == 0
+        assert _usage_rows_left(db, user_ids) == (0, 0)
+
+
+def test_get_user_skips_deleted_user_with_same_name():
+    with TestingSessionLocal() as db:
+        admin = _create_admin_with_users(
+            db,
+            old=dict(status=UserStatus.deleted),
+        )
+        deleted = _users_by_name(db, admin)["old"]
+        live = DBUser(username=deleted.username.upper(), admin_id=admin.id, status=UserStatus.active)
+        db.add(live)
+        db.commit()
+
+        # A Redis miss makes get_cached_user fall back to the database itself
+        redis_client = MagicMock()
+        redis_client.get.return_value = None
+        with patch("app.redis.cache.get_redis", return_value=redis_client):
+            assert crud.get_user(db, username=deleted.username).id == live.id
+        assert crud.get_user(db, username=deleted.username).id == live.id